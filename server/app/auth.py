@@ -1,10 +1,173 @@
+"""
+Authentication for Supabase-issued JWTs.
+
+Tokens are verified with SUPABASE_JWT_SECRET (HS256) or, for asymmetric
+tokens, with the project's JWKS keys from SUPABASE_URL. The keys are cached
+and refreshed in a background thread, and fetched again on an unknown key id.
+Without either setting, tokens are decoded unverified (local development
+only) and a warning is printed once.
+
+get_current_teacher returns a TeacherIdentity snapshot (id, user_id,
+school_id, name) that is kept in a bounded TTL cache keyed by the token's
+`sub`, so authenticated requests normally skip the teachers query. Committing
+any change to a Teacher row drops its cached snapshot.
+"""
+import os
+import sys
+import time
+import threading
+from typing import Any, Dict, Optional
+import jwt
+import requests
 from fastapi import HTTPException, Request, Depends
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from .database import get_db
 from .models import Teacher
-import jwt
 
-def get_current_teacher(request: Request, db: Session = Depends(get_db)):
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from services.memory_cache import LRUCache
+from services import metrics
+
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+# Unknown key ids trigger at most one JWKS fetch per this many seconds
+JWKS_MIN_FETCH_INTERVAL = 30.0
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+AUTH_TEACHER_CACHE_SIZE = int(os.getenv("AUTH_TEACHER_CACHE_SIZE", "1024"))
+AUTH_TEACHER_CACHE_TTL = float(os.getenv("AUTH_TEACHER_CACHE_TTL", "300"))
+
+
+class TeacherIdentity:
+    """The authenticated teacher's fields routes rely on, detached from any session."""
+    __slots__ = ("id", "user_id", "school_id", "name")
+
+    def __init__(self, id: int, user_id: Optional[str], school_id: Optional[int], name: Optional[str]):
+        self.id = id
+        self.user_id = user_id
+        self.school_id = school_id
+        self.name = name
+
+    @classmethod
+    def from_teacher(cls, teacher: Teacher) -> "TeacherIdentity":
+        return cls(teacher.id, teacher.user_id, teacher.school_id, teacher.name)
+
+
+# Supabase user id (`sub`) -> TeacherIdentity
+_teachers = LRUCache(maxsize=AUTH_TEACHER_CACHE_SIZE, ttl=AUTH_TEACHER_CACHE_TTL)
+
+
+class JWKSCache:
+    """Signing keys from the Supabase JWKS endpoint, refreshed in the background."""
+
+    def __init__(self, url: str, refresh_seconds: float):
+        self.url = url
+        self.refresh_seconds = refresh_seconds
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._last_fetch = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _fetch(self):
+        response = requests.get(self.url, timeout=10)
+        response.raise_for_status()
+        keys = {}
+        for key_data in response.json().get("keys", []):
+            try:
+                keys[key_data["kid"]] = jwt.PyJWK(key_data)
+            except (KeyError, jwt.PyJWKError) as e:
+                print(f"WARNING: Skipping unusable JWKS key: {str(e)}")
+        with self._lock:
+            self._keys = keys
+            self._last_fetch = time.monotonic()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self._fetch()
+            except Exception as e:
+                # Keep serving the keys we have; the next request with an unknown kid retries
+                print(f"WARNING: JWKS refresh failed: {str(e)}")
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refresh_loop, name="jwks-refresh", daemon=True)
+        self._thread.start()
+
+    def get_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        self._start()
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._last_fetch >= JWKS_MIN_FETCH_INTERVAL:
+            # First use, or keys were rotated since the last refresh
+            self._fetch()
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return key
+
+
+_jwks = JWKSCache(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", JWKS_REFRESH_SECONDS) if SUPABASE_URL else None
+_warned_unverified = False
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Verify a Supabase access token and return its claims."""
+    global _warned_unverified
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    audience_options = {"verify_aud": bool(SUPABASE_JWT_AUDIENCE)}
+
+    if algorithm == "HS256" and SUPABASE_JWT_SECRET:
+        return jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=["HS256"], audience=SUPABASE_JWT_AUDIENCE or None, options=audience_options)
+    if algorithm in ASYMMETRIC_ALGORITHMS and _jwks is not None:
+        key = _jwks.get_key(header.get("kid"))
+        return jwt.decode(token, key, algorithms=ASYMMETRIC_ALGORITHMS, audience=SUPABASE_JWT_AUDIENCE or None, options=audience_options)
+    if SUPABASE_JWT_SECRET or _jwks is not None:
+        raise jwt.InvalidTokenError(f"Unsupported token algorithm: {algorithm}")
+
+    if not _warned_unverified:
+        print("WARNING: SUPABASE_JWT_SECRET and SUPABASE_URL are not set; JWT signatures are NOT verified")
+        _warned_unverified = True
+    return jwt.decode(token, options={"verify_signature": False})
+
+
+def invalidate_teacher(user_id: Optional[str]) -> None:
+    if user_id:
+        _teachers.delete(user_id)
+
+
+def _load_teacher(db: Session, supabase_user_id: str) -> Teacher:
+    # Find teacher record - try by user_id first, then fallback to creating one
+    teacher = db.query(Teacher).filter(Teacher.user_id == supabase_user_id).first()
+    if teacher:
+        return teacher
+
+    # Auto-create teacher record for testing/demo purposes
+    teacher = Teacher(
+        name="Demo Teacher",
+        user_id=supabase_user_id,
+        subjects=["Mathematics", "Science"],
+        classes=["Grade 4", "Grade 5"]
+    )
+    db.add(teacher)
+    try:
+        db.commit()
+        db.refresh(teacher)
+        print(f"Auto-created teacher record for user: {supabase_user_id}")
+    except Exception as e:
+        db.rollback()
+        print(f"Failed to create teacher record: {e}")
+        raise HTTPException(status_code=500, detail="Failed to create teacher account")
+    return teacher
+
+
+def get_current_teacher(request: Request, db: Session = Depends(get_db)) -> TeacherIdentity:
     """Extract teacher ID from Supabase JWT token"""
     auth_header = request.headers.get("authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
@@ -13,48 +176,51 @@ def get_current_teacher(request: Request, db: Session = Depends(get_db)):
     token = auth_header.split(" ")[1]
 
     try:
-        # Decode JWT (Supabase uses RS256, but for simplicity we'll trust the token structure)
-        # In production, you'd verify the JWT signature
-        payload = jwt.decode(token, options={"verify_signature": False})
+        payload = decode_token(token)
 
         # Extract user_id from Supabase token
         supabase_user_id = payload.get("sub")
         if not supabase_user_id:
             raise HTTPException(status_code=401, detail="Invalid token: no user ID")
 
-        # Find teacher record - try by user_id first, then fallback to creating one
-        teacher = None
-        if hasattr(Teacher, 'user_id'):
-            teacher = db.query(Teacher).filter(Teacher.user_id == supabase_user_id).first()
-
-        if not teacher:
-            # Auto-create teacher record for testing/demo purposes
-            teacher_data = {"name": "Demo Teacher"}
-
-            # Add user_id if the model supports it
-            if hasattr(Teacher, 'user_id'):
-                teacher_data["user_id"] = supabase_user_id
-            if hasattr(Teacher, 'subjects'):
-                teacher_data["subjects"] = ["Mathematics", "Science"]
-            if hasattr(Teacher, 'classes'):
-                teacher_data["classes"] = ["Grade 4", "Grade 5"]
-
-            teacher = Teacher(**teacher_data)
-            db.add(teacher)
-            try:
-                db.commit()
-                db.refresh(teacher)
-                print(f"Auto-created teacher record for user: {supabase_user_id}")
-            except Exception as e:
-                db.rollback()
-                print(f"Failed to create teacher record: {e}")
-                raise HTTPException(status_code=500, detail="Failed to create teacher account")
+        identity = _teachers.get(supabase_user_id)
+        if identity is not None:
+            metrics.increment("auth_teacher_cache_hits")
+            return identity
 
-        return teacher
+        metrics.increment("auth_teacher_cache_misses")
+        identity = TeacherIdentity.from_teacher(_load_teacher(db, supabase_user_id))
+        _teachers.set(supabase_user_id, identity)
+        return identity
 
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Authentication error: {str(e)}")
+
+
+@event.listens_for(Session, "after_flush")
+def _note_changed_teachers(session, flush_context):
+    changed = set()
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, Teacher):
+            # Old and new user_id, in case it was the user_id that changed
+            history = inspect(obj).attrs.user_id.history
+            changed.update(value for value in (obj.user_id, *history.deleted) if value)
+    if changed:
+        session.info.setdefault("changed_teacher_user_ids", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_changed_teachers(session):
+    for user_id in session.info.pop("changed_teacher_user_ids", ()):
+        invalidate_teacher(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_teachers(session):
+    session.info.pop("changed_teacher_user_ids", None)
@@ -0,0 +1,250 @@
+"""
+Pre-serialized chapter index responses.
+
+The JSON for each (subject, grade, board) index is stored on its ChapterIndex
+row (payload / payload_etag) and kept in an in-process LRU, so a planner
+request is a dictionary lookup on a hit and a single-row read after a restart.
+Any flush that touches a Chapter or SubTopic clears the stored payload; it is
+rebuilt from one eager-loaded query the next time the index is read.
+"""
+import os
+import sys
+import json
+import hashlib
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session, selectinload
+from models.chapter_index import ChapterIndex, Chapter, SubTopic
+from . import curriculum_keys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from services.memory_cache import LRUCache
+from services import metrics
+
+CHAPTER_INDEX_CACHE_SIZE = int(os.getenv("CHAPTER_INDEX_CACHE_SIZE", "256"))
+# Bounds how long another worker process may serve an index after it changed
+CHAPTER_INDEX_CACHE_TTL = float(os.getenv("CHAPTER_INDEX_CACHE_TTL", "300"))
+
+# (subject, grade, board) -> (index id, payload, etag)
+_cache = LRUCache(maxsize=CHAPTER_INDEX_CACHE_SIZE, ttl=CHAPTER_INDEX_CACHE_TTL)
+
+
+def serialize_chapters(index: ChapterIndex) -> list:
+    return [
+        {
+            "id": chapter.id,
+            "chapterNumber": chapter.chapter_number,
+            "chapterName": chapter.chapter_name,
+            "description": chapter.description,
+            "subtopics": [
+                {
+                    "id": st.id,
+                    "subtopicNumber": st.subtopic_number,
+                    "subtopicName": st.subtopic_name,
+                    "description": st.description
+                }
+                for st in chapter.subtopics
+            ]
+        }
+        for chapter in index.chapters
+    ]
+
+
+def build_response(index: ChapterIndex, chapters: list, from_cache: bool) -> Dict[str, Any]:
+    return {
+        "indexId": index.id,
+        "subject": index.subject,
+        "grade": index.grade,
+        "board": index.board,
+        "chapters": chapters,
+        "fromCache": from_cache
+    }
+
+
+def _etag(payload: str) -> str:
+    return '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest() + '"'
+
+
+def store_payload(db: Session, index: ChapterIndex, chapters: list) -> Tuple[str, str]:
+    """Serialize the cached-read response for an index and persist it on the row."""
+    payload = json.dumps(build_response(index, chapters, from_cache=True), separators=(",", ":"))
+    etag = _etag(payload)
+    db.execute(
+        update(ChapterIndex).where(ChapterIndex.id == index.id).values(payload=payload, payload_etag=etag)
+    )
+    db.commit()
+    _cache.set(curriculum_keys.canonical_key(index.subject, index.grade, index.board, db), (index.id, payload, etag))
+    return payload, etag
+
+
+def _find_index_row(db: Session, subject: str, grade: int, board: str):
+    return db.execute(
+        select(ChapterIndex.id, ChapterIndex.payload, ChapterIndex.payload_etag).where(
+            ChapterIndex.subject == subject,
+            ChapterIndex.grade == grade,
+            ChapterIndex.board == board
+        )
+    ).first()
+
+
+def get_cached_index(db: Session, subject: str, grade: int, board: str) -> Optional[Tuple[str, str]]:
+    """
+    Return (payload JSON, ETag) for an existing index, or None if it has not
+    been generated yet. subject/board are canonicalized first.
+    """
+    key = curriculum_keys.canonical_key(subject, grade, board, db)
+    cached = _cache.get(key)
+    if cached is not None:
+        metrics.increment("chapter_index_memory_hits")
+        return cached[1], cached[2]
+
+    row = _find_index_row(db, *key)
+    if row is None and key != (subject, grade, board):
+        # Stored before keys were canonicalized and not merged yet (scripts/merge_chapter_indexes.py)
+        row = _find_index_row(db, subject, grade, board)
+    if row is None:
+        return None
+
+    if row.payload and row.payload_etag:
+        metrics.increment("chapter_index_payload_hits")
+        _cache.set(key, (row.id, row.payload, row.payload_etag))
+        return row.payload, row.payload_etag
+
+    # No stored payload (older row, or chapters changed): rebuild with two eager queries
+    metrics.increment("chapter_index_payload_rebuilds")
+    index = db.query(ChapterIndex).options(
+        selectinload(ChapterIndex.chapters).selectinload(Chapter.subtopics)
+    ).filter(ChapterIndex.id == row.id).one()
+    return store_payload(db, index, serialize_chapters(index))
+
+
+def _insert_returning_ids(db: Session, table, rows: List[Dict[str, Any]], parent_column) -> List[int]:
+    """
+    Insert rows and return their ids in row order.
+    Uses INSERT ... RETURNING with sort_by_parameter_order where the dialect
+    supports it (PostgreSQL, SQLite, MariaDB); SQLAlchemy batches it as far as
+    it can guarantee the order. MySQL has no RETURNING, so it gets a plain
+    executemany (multi-row INSERT) followed by reading the new ids back in
+    insertion order.
+    """
+    if not rows:
+        return []
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        return list(db.execute(statement, rows).scalars())
+
+    db.execute(insert(table), rows)
+    parent_ids = {row[parent_column.name] for row in rows}
+    return list(db.execute(
+        select(table.c.id).where(parent_column.in_(parent_ids)).order_by(table.c.id)
+    ).scalars())
+
+
+def persist_chapter_index(db: Session, subject: str, grade: int, board: str, index_data: Dict[str, Any]) -> Tuple[ChapterIndex, list]:
+    """
+    Store a generated chapter index under its canonical key: the index row,
+    then all chapters and then all subtopics as one batched INSERT each.
+    Returns the index and the serialized chapters (with ids). The caller commits.
+    """
+    subject, grade, board = curriculum_keys.canonical_key(subject, grade, board, db)
+    new_index = ChapterIndex(subject=subject, grade=grade, board=board)
+    db.add(new_index)
+    db.flush()  # Get the ID
+
+    chapter_infos = index_data.get("chapters", [])
+    chapter_rows = [
+        {
+            "index_id": new_index.id,
+            "chapter_number": chapter_info["chapterNumber"],
+            "chapter_name": chapter_info["chapterName"],
+            "description": chapter_info.get("description", "")
+        }
+        for chapter_info in chapter_infos
+    ]
+    chapters_table = Chapter.__table__
+    chapter_ids = _insert_returning_ids(db, chapters_table, chapter_rows, chapters_table.c.index_id)
+
+    subtopic_rows = [
+        {
+            "chapter_id": chapter_id,
+            "subtopic_number": subtopic_info["subtopicNumber"],
+            "subtopic_name": subtopic_info["subtopicName"],
+            "description": subtopic_info.get("description", "")
+        }
+        for chapter_id, chapter_info in zip(chapter_ids, chapter_infos)
+        for subtopic_info in chapter_info.get("subtopics", [])
+    ]
+    subtopics_table = SubTopic.__table__
+    subtopic_ids = _insert_returning_ids(db, subtopics_table, subtopic_rows, subtopics_table.c.chapter_id)
+
+    subtopics_by_chapter = defaultdict(list)
+    for subtopic_id, row in zip(subtopic_ids, subtopic_rows):
+        subtopics_by_chapter[row["chapter_id"]].append({
+            "id": subtopic_id,
+            "subtopicNumber": row["subtopic_number"],
+            "subtopicName": row["subtopic_name"],
+            "description": row["description"]
+        })
+
+    chapters_data = [
+        {
+            "id": chapter_id,
+            "chapterNumber": row["chapter_number"],
+            "chapterName": row["chapter_name"],
+            "description": row["description"],
+            "subtopics": subtopics_by_chapter[chapter_id]
+        }
+        for chapter_id, row in zip(chapter_ids, chapter_rows)
+    ]
+
+    return new_index, chapters_data
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def invalidate_index(index_id: int) -> None:
+    _cache.delete_where(lambda key, value: value[0] == index_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _clear_changed_payloads(session, flush_context):
+    """Clear stored payloads of indexes whose chapters or subtopics were just flushed."""
+    changed = [obj for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, (Chapter, SubTopic))]
+    if not changed:
+        return
+
+    index_ids = {obj.index_id for obj in changed if isinstance(obj, Chapter) and obj.index_id}
+    chapter_ids = {obj.chapter_id for obj in changed if isinstance(obj, SubTopic) and obj.chapter_id}
+    connection = session.connection()
+    if chapter_ids:
+        chapters = Chapter.__table__
+        index_ids.update(connection.execute(
+            select(chapters.c.index_id).where(chapters.c.id.in_(chapter_ids))
+        ).scalars())
+    if not index_ids:
+        return
+
+    indexes = ChapterIndex.__table__
+    connection.execute(
+        update(indexes)
+        .where(indexes.c.id.in_(index_ids), indexes.c.payload.is_not(None))
+        .values(payload=None, payload_etag=None)
+    )
+    session.info.setdefault("changed_chapter_indexes", set()).update(index_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_changed_from_memory(session):
+    for index_id in session.info.pop("changed_chapter_indexes", ()):
+        invalidate_index(index_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed(session):
+    session.info.pop("changed_chapter_indexes", None)
@@ -0,0 +1,152 @@
+"""
+Compressed storage for lesson plan content.
+
+With LESSON_PLAN_COMPRESSION set to "zlib" or "zstd", LessonPlan.content is
+written to content_blob as compressed JSON instead of the plain JSON column.
+Plans repeat the same keys and much of the same teacher-script phrasing, so
+both codecs use a shared dictionary trained on stored plans
+(scripts/train_content_dictionary.py) and kept in the content_dictionaries
+table. Every blob starts with a small header naming its codec and dictionary,
+so rows written with older dictionaries (or no dictionary) stay readable.
+
+zstd needs the optional `zstandard` package; without it "zstd" falls back to zlib.
+"""
+import os
+import json
+import zlib
+import time
+import struct
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from sqlalchemy import select, func
+
+try:
+    import zstandard
+except ImportError:  # zlib is used when zstandard is not installed
+    zstandard = None
+
+from .database import engine
+
+LESSON_PLAN_COMPRESSION = os.getenv("LESSON_PLAN_COMPRESSION", "").strip().lower()
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+# zlib only looks back 32 KB, so a longer preset dictionary is wasted
+ZLIB_MAX_DICT_BYTES = 32 * 1024
+# How long a worker keeps using its newest dictionary before checking for a newer one
+DICTIONARY_REFRESH_SECONDS = float(os.getenv("CONTENT_DICT_REFRESH_SECONDS", "300"))
+
+MAGIC = b"LPZ"
+HEADER = struct.Struct(">3sBI")  # magic, codec, dictionary id (0 = none)
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {"zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+# Dictionaries never change once stored, so loaded ones are kept for the process lifetime
+_dictionaries: Dict[int, bytes] = {}
+_latest: Dict[int, tuple] = {}  # codec -> (dictionary id, checked at)
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=8)
+def resolve_codec(name: Optional[str] = None) -> Optional[int]:
+    """Codec id for a name (default LESSON_PLAN_COMPRESSION), or None when compression is off."""
+    name = (LESSON_PLAN_COMPRESSION if name is None else name).strip().lower()
+    if not name or name in ("0", "off", "none", "false"):
+        return None
+    if name not in CODEC_NAMES:
+        raise ValueError(f"Unknown lesson plan compression codec: {name}")
+    if CODEC_NAMES[name] == CODEC_ZSTD and zstandard is None:
+        print("WARNING: zstandard is not installed; compressing lesson plans with zlib")
+        return CODEC_ZLIB
+    return CODEC_NAMES[name]
+
+
+def compression_enabled() -> bool:
+    return resolve_codec() is not None
+
+
+def _load_dictionary(dictionary_id: int) -> bytes:
+    data = _dictionaries.get(dictionary_id)
+    if data is None:
+        from .models import ContentDictionary
+        with engine.connect() as connection:
+            data = connection.execute(
+                select(ContentDictionary.data).where(ContentDictionary.id == dictionary_id)
+            ).scalar()
+        if data is None:
+            raise ValueError(f"Content dictionary {dictionary_id} not found")
+        _dictionaries[dictionary_id] = data
+    return data
+
+
+def _latest_dictionary_id(codec: int) -> int:
+    """Newest stored dictionary for a codec (0 if none), re-checked every DICTIONARY_REFRESH_SECONDS."""
+    now = time.monotonic()
+    with _lock:
+        cached = _latest.get(codec)
+        if cached and now - cached[1] < DICTIONARY_REFRESH_SECONDS:
+            return cached[0]
+    from .models import ContentDictionary
+    codec_name = next(name for name, value in CODEC_NAMES.items() if value == codec)
+    with engine.connect() as connection:
+        dictionary_id = connection.execute(
+            select(func.max(ContentDictionary.id)).where(ContentDictionary.codec == codec_name)
+        ).scalar() or 0
+    with _lock:
+        _latest[codec] = (dictionary_id, now)
+    return dictionary_id
+
+
+def forget_latest_dictionary():
+    """Make the next encode look for a newer dictionary (after training one)."""
+    with _lock:
+        _latest.clear()
+
+
+def compress(raw: bytes, codec: int, dictionary: Optional[bytes]) -> bytes:
+    if codec == CODEC_ZSTD:
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress(raw)
+    if dictionary:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, zdict=dictionary[-ZLIB_MAX_DICT_BYTES:])
+    else:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def decompress(data: bytes, codec: int, dictionary: Optional[bytes]) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Lesson plan content is zstd-compressed but zstandard is not installed")
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+    if codec == CODEC_ZLIB:
+        if dictionary:
+            decompressor = zlib.decompressobj(-15, zdict=dictionary[-ZLIB_MAX_DICT_BYTES:])
+        else:
+            decompressor = zlib.decompressobj(-15)
+        return decompressor.decompress(data) + decompressor.flush()
+    raise ValueError(f"Unknown lesson plan content codec: {codec}")
+
+
+def dump_json(content: Any) -> bytes:
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode(content: Any, codec: Optional[int] = None, dictionary_id: Optional[int] = None) -> bytes:
+    """Compress content as header + compressed JSON, with the newest dictionary by default."""
+    codec = codec or resolve_codec() or CODEC_ZLIB
+    if dictionary_id is None:
+        dictionary_id = _latest_dictionary_id(codec)
+    dictionary = _load_dictionary(dictionary_id) if dictionary_id else None
+    return HEADER.pack(MAGIC, codec, dictionary_id) + compress(dump_json(content), codec, dictionary)
+
+
+def decode(blob: bytes) -> Any:
+    magic, codec, dictionary_id = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a compressed lesson plan blob")
+    dictionary = _load_dictionary(dictionary_id) if dictionary_id else None
+    return json.loads(decompress(blob[HEADER.size:], codec, dictionary))
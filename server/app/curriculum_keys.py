@@ -0,0 +1,129 @@
+"""
+Canonical (subject, grade, board) keys for chapter indexes.
+
+"Science", "science " and "General Science" or "CBSE" and "cbse" must find the
+same stored index instead of each triggering a Gemini generation. Values are
+normalized (case, whitespace, punctuation), looked up in the built-in aliases
+below and in the key_aliases table, and otherwise title-cased.
+"""
+import os
+import re
+import sys
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models.chapter_index import KeyAlias
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from services.memory_cache import LRUCache
+
+SUBJECT = "subject"
+BOARD = "board"
+
+# Normalized spelling -> canonical value
+SUBJECT_ALIASES: Dict[str, str] = {
+    "math": "Mathematics",
+    "maths": "Mathematics",
+    "mathematics": "Mathematics",
+    "science": "Science",
+    "general science": "Science",
+    "sci": "Science",
+    "english": "English",
+    "english language": "English",
+    "english literature": "English Literature",
+    "hindi": "Hindi",
+    "sanskrit": "Sanskrit",
+    "evs": "Environmental Studies",
+    "environmental studies": "Environmental Studies",
+    "environmental science": "Environmental Studies",
+    "social science": "Social Science",
+    "social studies": "Social Science",
+    "sst": "Social Science",
+    "computer": "Computer Science",
+    "computers": "Computer Science",
+    "computer science": "Computer Science",
+    "cs": "Computer Science",
+    "physics": "Physics",
+    "chemistry": "Chemistry",
+    "biology": "Biology",
+    "bio": "Biology",
+    "history": "History",
+    "geography": "Geography",
+    "civics": "Civics",
+    "economics": "Economics",
+}
+
+BOARD_ALIASES: Dict[str, str] = {
+    "cbse": "CBSE",
+    "central board of secondary education": "CBSE",
+    "ncert": "CBSE",
+    "icse": "ICSE",
+    "cisce": "ICSE",
+    "isc": "ICSE",
+    "state": "State Board",
+    "state board": "State Board",
+    "ib": "IB",
+    "international baccalaureate": "IB",
+    "igcse": "IGCSE",
+    "cambridge": "IGCSE",
+    "cambridge igcse": "IGCSE",
+}
+
+_BUILTIN_ALIASES = {SUBJECT: SUBJECT_ALIASES, BOARD: BOARD_ALIASES}
+
+# kind -> {alias: canonical} from the key_aliases table
+_db_aliases = LRUCache(maxsize=4, ttl=float(os.getenv("KEY_ALIAS_CACHE_TTL", "300")))
+
+_PUNCTUATION = re.compile(r"[^\w\s&+]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(value: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace: " Gen. Science " -> "gen science"."""
+    value = _PUNCTUATION.sub(" ", (value or "").casefold())
+    return _WHITESPACE.sub(" ", value).strip()
+
+
+def _load_db_aliases(db: Session, kind: str) -> Dict[str, str]:
+    aliases = _db_aliases.get(kind)
+    if aliases is None:
+        rows = db.execute(select(KeyAlias.alias, KeyAlias.canonical).where(KeyAlias.kind == kind)).all()
+        aliases = {alias: canonical for alias, canonical in rows}
+        _db_aliases.set(kind, aliases)
+    return aliases
+
+
+def _fallback(kind: str, normalized: str) -> str:
+    # Short single-word boards are acronyms ("wbbse" -> "WBBSE")
+    if kind == BOARD and " " not in normalized and len(normalized) <= 6:
+        return normalized.upper()
+    return " ".join(word.capitalize() for word in normalized.split(" "))
+
+
+def canonical_value(kind: str, value: str, db: Optional[Session] = None) -> str:
+    normalized = normalize(value)
+    if db is not None:
+        canonical = _load_db_aliases(db, kind).get(normalized)
+        if canonical:
+            return canonical
+    return _BUILTIN_ALIASES[kind].get(normalized) or _fallback(kind, normalized)
+
+
+def canonical_key(subject: str, grade: int, board: str, db: Optional[Session] = None) -> Tuple[str, int, str]:
+    """Canonical (subject, grade, board) used for every chapter index lookup and insert."""
+    return canonical_value(SUBJECT, subject, db), int(grade), canonical_value(BOARD, board, db)
+
+
+def add_alias(db: Session, kind: str, alias: str, canonical: str) -> KeyAlias:
+    """Map another spelling to a canonical value (the caller commits)."""
+    if kind not in _BUILTIN_ALIASES:
+        raise ValueError(f"Unknown alias kind: {kind}")
+    normalized = normalize(alias)
+    row = db.query(KeyAlias).filter(KeyAlias.kind == kind, KeyAlias.alias == normalized).first()
+    if row:
+        row.canonical = canonical
+    else:
+        row = KeyAlias(kind=kind, alias=normalized, canonical=canonical)
+        db.add(row)
+    _db_aliases.delete(kind)
+    return row
@@ -0,0 +1,198 @@
+"""
+Delta-based lesson plan versions.
+
+A tweak is stored as a new LessonPlan row pointing at the plan it was made
+from (parent_id) with only the differences in patch_data, instead of a full
+copy of the content. Every LESSON_PLAN_SNAPSHOT_EVERY versions (or when the
+changes are a large part of the plan) a full snapshot is stored instead, so
+rebuilding any version applies at most that many deltas. Rebuilt content is
+kept in an in-process LRU.
+
+Delta format: a list of operations on paths of dict keys / list indexes,
+["set", path, value] or ["del", path]. Lists are compared element by element
+when their lengths match and replaced whole otherwise.
+"""
+import os
+import sys
+from typing import Any, Dict, List, Optional
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+from .models import LessonPlan
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from services.memory_cache import LRUCache
+from services import metrics
+
+LESSON_PLAN_SNAPSHOT_EVERY = int(os.getenv("LESSON_PLAN_SNAPSHOT_EVERY", "10"))
+# A delta bigger than this share of the full plan is stored as a snapshot instead
+SNAPSHOT_DELTA_RATIO = 0.5
+LESSON_PLAN_VERSION_CACHE_SIZE = int(os.getenv("LESSON_PLAN_VERSION_CACHE_SIZE", "256"))
+
+# lesson plan id -> rebuilt content (treat as read-only; it shares structure with its parent's)
+_cache = LRUCache(maxsize=LESSON_PLAN_VERSION_CACHE_SIZE, ttl=float(os.getenv("LESSON_PLAN_VERSION_CACHE_TTL", "600")))
+
+
+def diff(old: Any, new: Any, path: Optional[list] = None) -> List[list]:
+    """Operations that turn old into new."""
+    path = path or []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in new.items():
+            if key not in old:
+                ops.append(["set", path + [key], value])
+            elif old[key] != value:
+                ops.extend(diff(old[key], value, path + [key]))
+        ops.extend(["del", path + [key]] for key in old if key not in new)
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            if old_item != new_item:
+                ops.extend(diff(old_item, new_item, path + [index]))
+        return ops
+    return [] if old == new else [["set", path, new]]
+
+
+def apply_delta(content: Any, ops: List[list]) -> Any:
+    """Apply operations, copying only the containers along changed paths."""
+    copied = set()  # ids of containers already copied for this delta
+
+    def writable(container):
+        clone = dict(container) if isinstance(container, dict) else list(container)
+        copied.add(id(clone))
+        return clone
+
+    if not ops:
+        return content
+    root = writable(content) if isinstance(content, (dict, list)) else content
+    for op in ops:
+        kind, path = op[0], op[1]
+        if not path:
+            root = op[2]
+            continue
+        parent = root
+        for key in path[:-1]:
+            child = parent[key]
+            if id(child) not in copied:
+                child = writable(child)
+                parent[key] = child
+            parent = child
+        if kind == "set":
+            parent[path[-1]] = op[2]
+        elif kind == "del":
+            del parent[path[-1]]
+    return root
+
+
+def _stored_content(plan: LessonPlan) -> Optional[Any]:
+    if plan.content_json is None and plan.content_blob is None:
+        return None
+    return plan.content
+
+
+def resolve_content(db: Session, plan: LessonPlan) -> Any:
+    """Full content of any version: its own snapshot, or its nearest snapshot plus deltas."""
+    cached = _cache.get(plan.id)
+    if cached is not None:
+        metrics.increment("lesson_plan_version_cache_hits")
+        return cached
+
+    # Walk up to the nearest snapshot or cached ancestor
+    chain = []
+    current = plan
+    content = None
+    while True:
+        if current.id != plan.id:
+            content = _cache.get(current.id)
+            if content is not None:
+                break
+        content = _stored_content(current)
+        if content is not None or current.parent_id is None:
+            break
+        chain.append(current)
+        current = db.get(LessonPlan, current.parent_id)
+        if current is None:
+            raise ValueError(f"Lesson plan {chain[-1].id} has a missing parent")
+
+    metrics.increment("lesson_plan_version_rebuilds")
+    if content is None:
+        content = {}
+    for version in reversed(chain):
+        content = apply_delta(content, version.patch_data or [])
+    _cache.set(plan.id, content)
+    return content
+
+
+def create_version(db: Session, parent: LessonPlan, content: Dict[str, Any], **fields) -> LessonPlan:
+    """
+    Add a new version of `parent` holding `content` (the caller commits).
+    Stored as a delta against the parent unless a snapshot is due.
+    """
+    parent_content = resolve_content(db, parent)
+    version = (parent.version or 1) + 1
+    ops = diff(parent_content, content)
+
+    plan = LessonPlan(
+        parent_id=parent.id,
+        root_id=parent.root_id or parent.id,
+        version=version,
+        **fields
+    )
+    snapshot_due = LESSON_PLAN_SNAPSHOT_EVERY > 0 and version % LESSON_PLAN_SNAPSHOT_EVERY == 0
+    if snapshot_due or len(repr(ops)) > SNAPSHOT_DELTA_RATIO * len(repr(content)):
+        plan.content = content
+    else:
+        plan.patch_data = ops
+        # Metadata columns can't be derived from a delta; take them from the full content
+        for name, value in LessonPlan.metadata_from_content(content).items():
+            setattr(plan, name, value)
+    db.add(plan)
+    db.flush()
+    _cache.set(plan.id, content)
+    return plan
+
+
+def list_versions(db: Session, plan: LessonPlan) -> List[Dict[str, Any]]:
+    """Every version sharing plan's root, oldest first, without loading content."""
+    root_id = plan.root_id or plan.id
+    rows = db.query(
+        LessonPlan.id, LessonPlan.parent_id, LessonPlan.version, LessonPlan.title,
+        LessonPlan.source_type, LessonPlan.created_at, LessonPlan.patch_data.is_(None).label("is_snapshot")
+    ).filter(
+        or_(LessonPlan.id == root_id, LessonPlan.root_id == root_id)
+    ).order_by(LessonPlan.version, LessonPlan.id).all()
+    return [
+        {
+            "id": row.id,
+            "parentId": row.parent_id,
+            "version": row.version or 1,
+            "title": row.title,
+            "sourceType": row.source_type,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "isSnapshot": bool(row.is_snapshot)
+        }
+        for row in rows
+    ]
+
+
+@event.listens_for(Session, "after_flush")
+def _note_rewritten_content(session, flush_context):
+    """Versions built on a plan whose stored content was rewritten must be rebuilt."""
+    for obj in session.dirty:
+        if not isinstance(obj, LessonPlan):
+            continue
+        attrs = inspect(obj).attrs
+        if any(attrs[name].history.has_changes() for name in ("content_json", "content_blob", "patch_data")):
+            session.info["lesson_plan_content_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_rebuilt_versions(session):
+    if session.info.pop("lesson_plan_content_changed", False):
+        _cache.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rewritten_content(session):
+    session.info.pop("lesson_plan_content_changed", None)
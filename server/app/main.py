@@ -7,8 +7,16 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from models.quiz import Quiz, QuizResponse, QuestionType, DifficultyLevel
+from services import metrics
+from services.pdf_render_service import render_service
+from database import engine as planning_engine  # Engine of the quiz/planning models' Base
+from .sql_instrumentation import instrument_engine, SQLInstrumentationMiddleware
 import os
 
+# Per-request SQL counts, timings and N+1 warnings (replaces echo)
+instrument_engine(engine)
+instrument_engine(planning_engine)
+
 # Create tables
 Base.metadata.create_all(bind=engine)
 
@@ -21,7 +29,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-SQL-Count", "X-SQL-Time-Ms", "X-SQL-N-Plus-One"],
 )
+app.add_middleware(SQLInstrumentationMiddleware)
 
 app.include_router(schools.router)
 app.include_router(teachers.router)
@@ -32,6 +42,15 @@ app.include_router(classes.router)
 app.include_router(chapter_index.router)
 app.include_router(tts.router)
 
+@app.on_event("shutdown")
+def shutdown_render_pool():
+    render_service.shutdown()
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Classroom Curator API"}
+
+@app.get("/metrics")
+def read_metrics():
+    """In-process counters, gauges and timings (render queue, caches, ...)."""
+    return metrics.snapshot()
@@ -1,14 +1,17 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, Index, LargeBinary, event, inspect
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.orm.attributes import flag_modified
 from datetime import datetime
 from .database import Base
+from . import content_codec
 
 # Import planning models
 from models.planning import YearPlan, Term, Unit
 # Import quiz models
 from models.quiz import Quiz, QuizResponse, QuestionType, DifficultyLevel
 # Import chapter index models
-from models.chapter_index import ChapterIndex, Chapter, SubTopic, TeachingProgress
+from models.chapter_index import ChapterIndex, Chapter, SubTopic, TeachingProgress, TaughtSubtopic, TeachingProgressSummary, KeyAlias
 
 class School(Base):
     __tablename__ = "schools"
@@ -61,9 +64,108 @@ class LessonPlan(Base):
     class_id = Column(Integer, ForeignKey("classes.id"), nullable=True) # New FK to classes table
     title = Column(String(255))
     # subject removed, now in Class
-    content = Column(JSON)  # Store full lesson plan JSON
+    # Full lesson plan JSON, read and written through the `content` property below.
+    # Exactly one of the two columns is set; both are only loaded when content is used.
+    content_json = deferred(Column("content", JSON(none_as_null=True)), group="content")
+    content_blob = deferred(Column(LargeBinary().with_variant(mysql.MEDIUMBLOB(), "mysql")), group="content")  # Compressed (app/content_codec.py)
     source_type = Column(String(50))  # "topic" | "pdf" | "youtube"
     source_url = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Copied from content on every write (see sync_metadata) so listings never read content
+    subject = Column(String(100), nullable=True, index=True)
+    grade = Column(Integer, nullable=True, index=True)
+    board = Column(String(50), nullable=True, index=True)
+    chapter_id = Column(Integer, nullable=True)  # No FK: chapters can be merged away (scripts/merge_chapter_indexes.py)
+    topic = Column(String(255), nullable=True)
+
+    # Versions (app/lesson_plan_versions.py): a tweak points at the plan it was made from and
+    # stores only its changes in patch_data; content is set only on snapshots
+    parent_id = Column(Integer, ForeignKey("lesson_plans.id"), nullable=True)
+    root_id = Column(Integer, nullable=True, index=True)  # First version of the chain; NULL on the first version itself
+    version = Column(Integer, nullable=False, default=1)
+    patch_data = deferred(Column(JSON(none_as_null=True), nullable=True), group="content")
+
     class_ = relationship("Class", back_populates="lesson_plans")
+
+    __table_args__ = (
+        Index('ix_lesson_plans_user_topic', 'user_id', 'topic', 'subject', 'grade'),
+        Index('ix_lesson_plans_user_chapter', 'user_id', 'chapter_id'),
+        # History pages: WHERE user_id, source_type ORDER BY created_at DESC, id DESC
+        Index('ix_lesson_plans_user_source_created', 'user_id', 'source_type', 'created_at', 'id'),
+    )
+
+    @staticmethod
+    def metadata_from_content(content) -> dict:
+        """Subject, grade, board, chapter_id and topic as stored in a lesson plan's content."""
+        if not isinstance(content, dict):
+            return {"subject": None, "grade": None, "board": None, "chapter_id": None, "topic": None}
+
+        def as_int(value):
+            try:
+                return int(value) if value is not None else None
+            except (TypeError, ValueError):
+                return None
+
+        topic = content.get("topic") or content.get("title")
+        return {
+            "subject": (content.get("subject") or None) and str(content.get("subject"))[:100],
+            "grade": as_int(content.get("grade")),
+            "board": (content.get("board") or None) and str(content.get("board"))[:50],
+            "chapter_id": as_int(content.get("chapterId")),
+            "topic": topic[:255] if isinstance(topic, str) else None
+        }
+
+    @property
+    def content(self):
+        if self.content_blob is None:
+            return self.content_json
+        # Decompressed once per loaded blob
+        memo = self.__dict__.get("_content_memo")
+        if memo is None or memo[0] is not self.content_blob:
+            memo = (self.content_blob, content_codec.decode(self.content_blob))
+            self.__dict__["_content_memo"] = memo
+        return memo[1]
+
+    @content.setter
+    def content(self, value):
+        """Store compressed when LESSON_PLAN_COMPRESSION is set, as plain JSON otherwise."""
+        if value is not None and content_codec.compression_enabled():
+            self.content_blob = content_codec.encode(value)
+            self.__dict__["_content_memo"] = (self.content_blob, value)
+            self.content_json = None
+        else:
+            self.content_json = value
+            self.content_blob = None
+            # Callers may pass back the same dict after editing it in place
+            flag_modified(self, "content_json")
+
+    def sync_metadata(self):
+        if self.content_json is None and self.content_blob is None and self.patch_data is not None:
+            return  # Delta version: set from the full content by lesson_plan_versions.create_version
+        for name, value in self.metadata_from_content(self.content).items():
+            setattr(self, name, value)
+
+
+@event.listens_for(LessonPlan, "before_insert")
+def _sync_new_lesson_plan_metadata(mapper, connection, target):
+    target.sync_metadata()
+
+
+@event.listens_for(LessonPlan, "before_update")
+def _sync_lesson_plan_metadata(mapper, connection, target):
+    # Content is deferred; only re-derive metadata when it was actually rewritten
+    attrs = inspect(target).attrs
+    if attrs.content_json.history.has_changes() or attrs.content_blob.history.has_changes():
+        target.sync_metadata()
+
+
+class ContentDictionary(Base):
+    """Shared compression dictionary for lesson plan content (scripts/train_content_dictionary.py)."""
+    __tablename__ = "content_dictionaries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    codec = Column(String(10), nullable=False)  # "zlib" | "zstd"
+    data = Column(LargeBinary().with_variant(mysql.MEDIUMBLOB(), "mysql"), nullable=False)
+    sample_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
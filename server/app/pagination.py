@@ -0,0 +1,61 @@
+"""
+Keyset (cursor) pagination on (created_at, id), newest first.
+
+The cursor is an opaque URL-safe token holding the created_at and id of the
+last row of the previous page. The next page is read with
+"(created_at, id) < cursor" against a (…, created_at, id) index, so page 50
+costs the same as page 1, unlike LIMIT/OFFSET which scans every skipped row.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: Optional[datetime], row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Return (created_at, id) from a cursor; raises a 400 for anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at else None), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(query, created_at_column, id_column, cursor: Optional[str], limit: int):
+    """
+    Apply the cursor filter, newest-first order and limit to a query.
+    Fetches one extra row to know whether there is a next page; pass the
+    result rows to page_rows().
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if created_at is None:
+            # Rows without a timestamp sort last (NULLs are lowest on MySQL and SQLite)
+            query = query.filter(created_at_column.is_(None), id_column < row_id)
+        else:
+            query = query.filter(or_(
+                created_at_column < created_at,
+                and_(created_at_column == created_at, id_column < row_id),
+                created_at_column.is_(None)
+            ))
+    return query.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1), limit
+
+
+def page_rows(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Split off the look-ahead row; returns (page rows, next cursor or None)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
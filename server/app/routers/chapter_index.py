@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
+from sqlalchemy import select, func, distinct
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from ..database import get_db
 from ..models import Teacher, Class
-from models.chapter_index import ChapterIndex, Chapter, SubTopic, TeachingProgress
+from models.chapter_index import ChapterIndex, Chapter, SubTopic, TeachingProgress, TaughtSubtopic
+from .. import chapter_index_store, curriculum_keys, teaching_progress
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -21,6 +23,8 @@ def get_or_generate_chapter_index(
     subject: str,
     grade: int,
     board: str,
+    request: Request,
+    chunked: Optional[bool] = None,
     current_teacher: Teacher = Depends(get_current_teacher),
     db: Session = Depends(get_db)
 ):
@@ -28,110 +32,40 @@ def get_or_generate_chapter_index(
     Get existing chapter index from database or generate new one for subject/grade/board.
     If generated, stores permanently in database for all future teachers to use.
     Returns the chapter index with all chapters and subtopics.
+    chunked=true generates the chapter list first and subtopics in parallel
+    chunks (for large syllabi); defaults to CHAPTER_INDEX_CHUNKED.
     """
     try:
-        # Check if index already exists in database
-        existing_index = db.query(ChapterIndex).filter(
-            ChapterIndex.subject == subject,
-            ChapterIndex.grade == grade,
-            ChapterIndex.board == board
-        ).first()
+        # Check if index already exists (pre-serialized, see chapter_index_store)
+        cached = chapter_index_store.get_cached_index(db, subject, grade, board)
         
-        if existing_index:
-            print(f"DEBUG: Found existing chapter index (ID: {existing_index.id}) for {subject} Grade {grade} {board}")
-            # Return existing index with chapters and subtopics
-            chapters_data = []
-            for chapter in existing_index.chapters:
-                subtopics_data = [
-                    {
-                        "id": st.id,
-                        "subtopicNumber": st.subtopic_number,
-                        "subtopicName": st.subtopic_name,
-                        "description": st.description
-                    }
-                    for st in chapter.subtopics
-                ]
-                chapters_data.append({
-                    "id": chapter.id,
-                    "chapterNumber": chapter.chapter_number,
-                    "chapterName": chapter.chapter_name,
-                    "description": chapter.description,
-                    "subtopics": subtopics_data
-                })
-            
-            return {
-                "indexId": existing_index.id,
-                "subject": existing_index.subject,
-                "grade": existing_index.grade,
-                "board": existing_index.board,
-                "chapters": chapters_data,
-                "fromCache": True
-            }
+        if cached:
+            payload, etag = cached
+            print(f"DEBUG: Serving cached chapter index for {subject} Grade {grade} {board}")
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+            if chapter_index_store.etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers=headers)
+            return Response(content=payload, media_type="application/json", headers=headers)
         
-        # Generate new index using LLM
+        # Generate new index using LLM, under the canonical spelling
+        subject, grade, board = curriculum_keys.canonical_key(subject, grade, board, db)
         print(f"DEBUG: Generating new chapter index for {subject} Grade {grade} {board}")
-        index_data = llm_service.generate_chapter_index(subject, grade, board)
+        use_chunked = llm_service.CHAPTER_INDEX_CHUNKED if chunked is None else chunked
+        if use_chunked:
+            index_data = llm_service.generate_chapter_index_chunked(subject, grade, board)
+        else:
+            index_data = llm_service.generate_chapter_index(subject, grade, board)
         
-        # Create new ChapterIndex record
-        new_index = ChapterIndex(
-            subject=subject,
-            grade=grade,
-            board=board
-        )
-        db.add(new_index)
-        db.flush()  # Get the ID
-        
-        # Create Chapter and SubTopic records
-        chapters_data = []
-        for chapter_info in index_data.get("chapters", []):
-            new_chapter = Chapter(
-                index_id=new_index.id,
-                chapter_number=chapter_info["chapterNumber"],
-                chapter_name=chapter_info["chapterName"],
-                description=chapter_info.get("description", "")
-            )
-            db.add(new_chapter)
-            db.flush()  # Get the chapter ID
-            
-            # Create subtopics
-            subtopics_data = []
-            for subtopic_info in chapter_info.get("subtopics", []):
-                new_subtopic = SubTopic(
-                    chapter_id=new_chapter.id,
-                    subtopic_number=subtopic_info["subtopicNumber"],
-                    subtopic_name=subtopic_info["subtopicName"],
-                    description=subtopic_info.get("description", "")
-                )
-                db.add(new_subtopic)
-                db.flush()
-                
-                subtopics_data.append({
-                    "id": new_subtopic.id,
-                    "subtopicNumber": new_subtopic.subtopic_number,
-                    "subtopicName": new_subtopic.subtopic_name,
-                    "description": new_subtopic.description
-                })
-            
-            chapters_data.append({
-                "id": new_chapter.id,
-                "chapterNumber": new_chapter.chapter_number,
-                "chapterName": new_chapter.chapter_name,
-                "description": new_chapter.description,
-                "subtopics": subtopics_data
-            })
+        # Store index, chapters and subtopics in a few batched inserts
+        new_index, chapters_data = chapter_index_store.persist_chapter_index(db, subject, grade, board, index_data)
         
         db.commit()
         
         print(f"DEBUG: Successfully created chapter index (ID: {new_index.id}) with {len(chapters_data)} chapters")
         
-        return {
-            "indexId": new_index.id,
-            "subject": new_index.subject,
-            "grade": new_index.grade,
-            "board": new_index.board,
-            "chapters": chapters_data,
-            "fromCache": False
-        }
+        chapter_index_store.store_payload(db, new_index, chapters_data)
+        
+        return chapter_index_store.build_response(new_index, chapters_data, from_cache=False)
     
     except Exception as e:
         db.rollback()
@@ -150,37 +84,8 @@ def get_teaching_progress(
     Returns which chapters/subtopics have been taught.
     """
     try:
-        progress_records = db.query(TeachingProgress).filter(
-            TeachingProgress.teacher_id == current_teacher.id,
-            TeachingProgress.class_id == class_id
-        ).all()
-        
-        # Group by chapter
-        progress_by_chapter = {}
-        for record in progress_records:
-            chapter_id = record.chapter_id
-            if chapter_id not in progress_by_chapter:
-                progress_by_chapter[chapter_id] = {
-                    "chapterId": chapter_id,
-                    "subtopicIds": [],
-                    "lastTaught": record.taught_at
-                }
-            
-            # Merge subtopic IDs
-            progress_by_chapter[chapter_id]["subtopicIds"].extend(record.subtopic_ids)
-            
-            # Update last taught date if more recent
-            if record.taught_at > progress_by_chapter[chapter_id]["lastTaught"]:
-                progress_by_chapter[chapter_id]["lastTaught"] = record.taught_at
-        
-        # Convert to list and format dates
-        progress_list = []
-        for chapter_id, data in progress_by_chapter.items():
-            progress_list.append({
-                "chapterId": data["chapterId"],
-                "subtopicIds": list(set(data["subtopicIds"])),  # Remove duplicates
-                "lastTaught": data["lastTaught"].isoformat() if data["lastTaught"] else None
-            })
+        # One pre-aggregated row per chapter (see app/teaching_progress.py)
+        progress_list = teaching_progress.get_progress_summary(db, current_teacher.id, class_id)
         
         return {"progress": progress_list}
     
@@ -206,8 +111,9 @@ def record_teaching_progress(
     Record that teacher has taught specific subtopics.
     """
     try:
-        # Create new teaching progress record
-        progress = TeachingProgress(
+        # Create new teaching progress record (and update the class summary)
+        progress = teaching_progress.record_progress(
+            db,
             teacher_id=current_teacher.id,
             chapter_id=request.chapterId,
             class_id=request.classId,
@@ -215,7 +121,6 @@ def record_teaching_progress(
             lesson_plan_id=request.lessonPlanId
         )
         
-        db.add(progress)
         db.commit()
         db.refresh(progress)
         
@@ -230,3 +135,101 @@ def record_teaching_progress(
         db.rollback()
         print(f"ERROR: Failed to record teaching progress: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to record teaching progress: {str(e)}")
+
+
+def _coverage_scope(query, current_teacher: Teacher):
+    """Restrict a taught_subtopics query to the teacher's school (or the teacher, without one)."""
+    if current_teacher.school_id:
+        return query.join(Teacher, Teacher.id == TaughtSubtopic.teacher_id).where(Teacher.school_id == current_teacher.school_id)
+    return query.where(TaughtSubtopic.teacher_id == current_teacher.id)
+
+
+@router.get("/coverage")
+def get_chapter_coverage(
+    index_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    current_teacher: Teacher = Depends(get_current_teacher),
+    db: Session = Depends(get_db)
+):
+    """
+    Coverage per chapter across the teacher's school: distinct subtopics taught
+    and the number of classes that taught the chapter. Optionally limited to one
+    chapter index or one class.
+    """
+    try:
+        query = select(
+            TaughtSubtopic.chapter_id,
+            func.count(distinct(TaughtSubtopic.subtopic_id)).label("taught"),
+            func.count(distinct(TaughtSubtopic.class_id)).label("classes"),
+            func.max(TaughtSubtopic.taught_at).label("last_taught")
+        )
+        query = _coverage_scope(query, current_teacher)
+        if index_id is not None:
+            query = query.where(TaughtSubtopic.chapter_id.in_(select(Chapter.id).where(Chapter.index_id == index_id)))
+        if class_id is not None:
+            query = query.where(TaughtSubtopic.class_id == class_id)
+        rows = db.execute(query.group_by(TaughtSubtopic.chapter_id)).all()
+        
+        totals = dict(db.execute(
+            select(SubTopic.chapter_id, func.count(SubTopic.id))
+            .where(SubTopic.chapter_id.in_([row.chapter_id for row in rows]))
+            .group_by(SubTopic.chapter_id)
+        ).all()) if rows else {}
+        
+        chapters = []
+        for row in rows:
+            total = totals.get(row.chapter_id, 0)
+            chapters.append({
+                "chapterId": row.chapter_id,
+                "taughtSubtopics": row.taught,
+                "totalSubtopics": total,
+                "coverage": round(100.0 * row.taught / total, 1) if total else 0.0,
+                "classes": row.classes,
+                "lastTaught": row.last_taught.isoformat() if row.last_taught else None
+            })
+        
+        return {"chapters": chapters}
+    
+    except Exception as e:
+        print(f"ERROR: Failed to get chapter coverage: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get chapter coverage: {str(e)}")
+
+
+@router.get("/coverage/subtopics/{subtopic_id}")
+def get_subtopic_coverage(
+    subtopic_id: int,
+    current_teacher: Teacher = Depends(get_current_teacher),
+    db: Session = Depends(get_db)
+):
+    """
+    Which classes in the teacher's school have covered a subtopic, how often
+    and when.
+    """
+    try:
+        query = select(
+            TaughtSubtopic.class_id,
+            TaughtSubtopic.teacher_id,
+            func.count(TaughtSubtopic.id).label("times"),
+            func.min(TaughtSubtopic.taught_at).label("first_taught"),
+            func.max(TaughtSubtopic.taught_at).label("last_taught")
+        ).where(TaughtSubtopic.subtopic_id == subtopic_id)
+        query = _coverage_scope(query, current_teacher)
+        rows = db.execute(query.group_by(TaughtSubtopic.class_id, TaughtSubtopic.teacher_id)).all()
+        
+        return {
+            "subtopicId": subtopic_id,
+            "classes": [
+                {
+                    "classId": row.class_id,
+                    "teacherId": row.teacher_id,
+                    "timesTaught": row.times,
+                    "firstTaught": row.first_taught.isoformat() if row.first_taught else None,
+                    "lastTaught": row.last_taught.isoformat() if row.last_taught else None
+                }
+                for row in rows
+            ]
+        }
+    
+    except Exception as e:
+        print(f"ERROR: Failed to get subtopic coverage: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get subtopic coverage: {str(e)}")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, Any, List
@@ -7,11 +7,12 @@ from ..models import LessonPlan, Teacher
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
-from services import pdf_extractor, youtube_service, llm_service, vector_service
+from services import pdf_extractor, youtube_service, llm_service, vector_service, tts_service
 import json
 
 # Import auth dependency
 from ..auth import get_current_teacher
+from .. import teaching_progress, pagination, lesson_plan_versions
 
 router = APIRouter(prefix="/lesson-plans", tags=["lesson-plans"])
 
@@ -21,9 +22,10 @@ def get_teacher_topics(class_id: Optional[int] = None, current_teacher: Teacher
     Get all unique topics from the teacher's lesson plans, optionally filtered by class_id.
     """
     try:
-        # Build query
-        query = db.query(LessonPlan.content).filter(
-            LessonPlan.user_id == current_teacher.id
+        # Metadata columns only; content is never loaded
+        query = db.query(LessonPlan.topic, LessonPlan.subject, LessonPlan.grade).filter(
+            LessonPlan.user_id == current_teacher.id,
+            LessonPlan.topic.isnot(None)
         )
         
         if class_id:
@@ -31,25 +33,15 @@ def get_teacher_topics(class_id: Optional[int] = None, current_teacher: Teacher
             
         lesson_plans = query.order_by(LessonPlan.created_at.desc()).all()
         
+        # Most recent plan wins for each topic
         topics_map = {}
-        for lp in lesson_plans:
-            # content is already a dict because of sqlalchemy JSON type, or str if legacy
-            content = lp[0]
-            if isinstance(content, str):
-                try:
-                    content = json.loads(content)
-                except:
-                    continue
-            
-            if isinstance(content, dict):
-                # Try to find topic in various places
-                topic = content.get("topic") or content.get("title")
-                if topic and topic not in topics_map:
-                    topics_map[topic] = {
-                        "topic": topic,
-                        "subject": content.get("subject", ""),
-                        "grade": content.get("grade", "")
-                    }
+        for topic, subject, grade in lesson_plans:
+            if topic not in topics_map:
+                topics_map[topic] = {
+                    "topic": topic,
+                    "subject": subject or "",
+                    "grade": grade if grade is not None else ""
+                }
                     
         # Return list of dicts sorted by topic name
         return {"topics": sorted(list(topics_map.values()), key=lambda x: x["topic"])}
@@ -60,6 +52,7 @@ class LessonPlanRequest(BaseModel):
     mode: str  # "topic" | "youtube" | "chapter"
     topic: Optional[str] = None
     youtubeUrl: Optional[str] = None
+    youtubeUrls: Optional[List[str]] = None  # Several videos (e.g. a playlist) for youtube mode
     chapterName: Optional[str] = None  # New: for chapter-based generation
     subtopicNames: Optional[List[str]] = None  # New: selected subtopics
     chapterId: Optional[int] = None  # New: chapter ID for progress tracking
@@ -72,20 +65,42 @@ class LessonPlanRequest(BaseModel):
     refinementPrompt: Optional[str] = None
     lessonPlanId: Optional[int] = None
     classId: Optional[int] = None
+    presynthesizeAudio: Optional[bool] = None  # Queue TTS for every teacherScript; defaults to TTS_PRESYNTHESIZE
+
+# Pre-synthesize lesson plan audio after save unless the request says otherwise
+TTS_PRESYNTHESIZE = os.getenv("TTS_PRESYNTHESIZE", "false").lower() == "true"
+
+def _queue_audio_presynthesis(background_tasks: BackgroundTasks, lesson_plan_id: int, content: Dict[str, Any], requested: Optional[bool] = None):
+    enabled = TTS_PRESYNTHESIZE if requested is None else requested
+    if not enabled or tts_service.audio_cache is None:
+        return
+    tts_service.presynthesis_jobs.set(lesson_plan_id, {"status": "queued"})
+    background_tasks.add_task(tts_service.presynthesize_lesson_plan, lesson_plan_id, content)
+    print(f"DEBUG: Queued audio pre-synthesis for lesson plan {lesson_plan_id}")
 
 @router.post("/generate")
-def generate_lesson_plan(request: LessonPlanRequest, current_teacher: Teacher = Depends(get_current_teacher), db: Session = Depends(get_db)):
+def generate_lesson_plan(request: LessonPlanRequest, background_tasks: BackgroundTasks, current_teacher: Teacher = Depends(get_current_teacher), db: Session = Depends(get_db)):
     """
     Generate lesson plan from topic or YouTube URL.
     """
     try:
         # Extract text based on mode
         if request.mode == "youtube":
-            if not request.youtubeUrl:
+            if request.youtubeUrls:
+                # Playlist: fetch all transcripts concurrently, skip videos without one
+                # The prompt budget is split between videos
+                text, skipped = youtube_service.get_playlist_text(request.youtubeUrls, topic=request.topic)
+                for url, error in skipped:
+                    print(f"DEBUG: Skipping {url}: {error}")
+                if not text:
+                    raise HTTPException(status_code=400, detail="No transcripts available for the given videos")
+                source_url = request.youtubeUrls[0]
+            elif request.youtubeUrl:
+                text = youtube_service.get_timed_transcript(request.youtubeUrl, topic=request.topic)
+                source_url = request.youtubeUrl
+            else:
                 raise HTTPException(status_code=400, detail="YouTube URL required for youtube mode")
-            text = youtube_service.get_transcript(request.youtubeUrl)
             source_type = "youtube"
-            source_url = request.youtubeUrl
         elif request.mode == "topic":
             if not request.topic:
                 raise HTTPException(status_code=400, detail="Topic text required for topic mode")
@@ -175,7 +190,9 @@ def generate_lesson_plan(request: LessonPlanRequest, current_teacher: Teacher =
                 text=text,
                 grade=request.grade or 5,
                 subject=request.subject or "General",
-                class_duration_mins=request.classDurationMins
+                class_duration_mins=request.classDurationMins,
+                source_has_timestamps=(source_type == "youtube"),
+                text_is_budgeted=(source_type == "youtube")
             )
 
             lesson_plan_data["sourceAttribution"] = {
@@ -209,16 +226,27 @@ def generate_lesson_plan(request: LessonPlanRequest, current_teacher: Teacher =
 
 
         # Save to database with authenticated teacher ID
-        lesson_plan = LessonPlan(
+        fields = dict(
             user_id=current_teacher.id,  # Use authenticated teacher ID
             title=lesson_plan_data.get("title", "Untitled Lesson Plan"),
-            content=lesson_plan_data,
             source_type=source_type,
             source_url=source_url,
             class_id=request.classId
         )
-
-        db.add(lesson_plan)
+        parent = None
+        if request.mode == "tweak" and request.lessonPlanId:
+            parent = db.query(LessonPlan).filter(
+                LessonPlan.id == request.lessonPlanId,
+                LessonPlan.user_id == current_teacher.id
+            ).first()
+
+        if parent:
+            # Tweaks are stored as a delta against the plan they were made from
+            lesson_plan = lesson_plan_versions.create_version(db, parent, lesson_plan_data, **fields)
+            print(f"DEBUG: Saved tweak of lesson plan {parent.id} as version {lesson_plan.version}")
+        else:
+            lesson_plan = LessonPlan(content=lesson_plan_data, **fields)
+            db.add(lesson_plan)
         db.commit()
         db.refresh(lesson_plan)
 
@@ -229,21 +257,23 @@ def generate_lesson_plan(request: LessonPlanRequest, current_teacher: Teacher =
             print(f"Failed to upsert to vector DB: {str(e)}")
             # Don't fail the whole request if vector storage fails
 
+        _queue_audio_presynthesis(background_tasks, lesson_plan.id, lesson_plan_data, request.presynthesizeAudio)
+
         # Record teaching progress if this is a chapter-based lesson plan
         if request.mode == "chapter" and request.chapterId and request.subtopicIds and request.classId:
             try:
-                from models.chapter_index import TeachingProgress
-                progress = TeachingProgress(
+                teaching_progress.record_progress(
+                    db,
                     teacher_id=current_teacher.id,
                     chapter_id=request.chapterId,
                     class_id=request.classId,
                     subtopic_ids=request.subtopicIds,
                     lesson_plan_id=lesson_plan.id
                 )
-                db.add(progress)
                 db.commit()
                 print(f"DEBUG: Recorded teaching progress for chapter {request.chapterId}")
             except Exception as e:
+                db.rollback()
                 print(f"Failed to record teaching progress: {str(e)}")
                 # Don't fail the whole request if progress recording fails
 
@@ -260,8 +290,10 @@ def generate_lesson_plan(request: LessonPlanRequest, current_teacher: Teacher =
 
 @router.post("/generate-from-pdf")
 def generate_lesson_plan_from_pdf(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     classDurationMins: int = Form(...),
+    presynthesizeAudio: Optional[bool] = Form(None),
     current_teacher: Teacher = Depends(get_current_teacher),
     db: Session = Depends(get_db)
 ):
@@ -315,6 +347,8 @@ def generate_lesson_plan_from_pdf(
         except Exception as e:
             print(f"Failed to upsert to vector DB (PDF): {str(e)}")
 
+        _queue_audio_presynthesis(background_tasks, lesson_plan.id, lesson_plan_data, presynthesizeAudio)
+
         # Return lesson plan with database ID
         response_data = lesson_plan_data.copy()
         response_data["id"] = lesson_plan.id
@@ -336,11 +370,30 @@ def get_lesson_plan(lesson_plan_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Lesson plan not found")
 
     # Return lesson plan content with ID
-    response_data = lesson_plan.content.copy()
+    response_data = dict(lesson_plan_versions.resolve_content(db, lesson_plan) or {})
     response_data["id"] = lesson_plan.id
 
     return response_data
 
+@router.get("/{lesson_plan_id}/versions")
+def get_lesson_plan_versions(lesson_plan_id: int, current_teacher: Teacher = Depends(get_current_teacher), db: Session = Depends(get_db)):
+    """
+    List every version (the original plan and its tweaks) of the chain a lesson plan belongs to.
+    """
+    lesson_plan = db.query(LessonPlan).filter(
+        LessonPlan.id == lesson_plan_id,
+        LessonPlan.user_id == current_teacher.id
+    ).first()
+    if not lesson_plan:
+        raise HTTPException(status_code=404, detail="Lesson plan not found")
+
+    try:
+        versions = lesson_plan_versions.list_versions(db, lesson_plan)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch lesson plan versions: {str(e)}")
+
+    return {"lessonPlanId": lesson_plan.id, "rootId": lesson_plan.root_id or lesson_plan.id, "versions": versions}
+
 @router.get("/history/{source_type}")
 def get_lesson_plan_history(
     source_type: str, 
@@ -348,86 +401,54 @@ def get_lesson_plan_history(
     chapter_id: Optional[int] = None,
     current_teacher: Teacher = Depends(get_current_teacher), 
     db: Session = Depends(get_db), 
-    limit: int = 10
+    limit: int = 10,
+    cursor: Optional[str] = None
 ):
     """
     Get lesson plan history for a specific source type (topic, pdf, youtube, lesson).
     Returns the most recent lesson plans filtered by source_type and optionally class_id and chapter_id.
+    Pass the returned nextCursor as `cursor` to get the following page.
     """
     if source_type not in ["topic", "pdf", "youtube", "lesson"]:
         raise HTTPException(status_code=400, detail="Invalid source type. Must be 'topic', 'pdf', 'youtube', or 'lesson'")
 
     try:
         print(f"DEBUG: Fetching history for source_type={source_type}, class_id={class_id}, chapter_id={chapter_id}", flush=True)
-        # Use raw SQL to avoid model column issues
-        from sqlalchemy import text
-
-        sql_query = """
-            SELECT id, title, content, source_url, source_type, created_at
-            FROM lesson_plans
-            WHERE source_type = :source_type AND user_id = :user_id
-        """
-        
-        params = {"source_type": source_type, "user_id": current_teacher.id, "limit": limit}
+        # Metadata columns only; content is never loaded
+        query = db.query(
+            LessonPlan.id, LessonPlan.title, LessonPlan.subject, LessonPlan.grade,
+            LessonPlan.created_at, LessonPlan.source_url, LessonPlan.source_type
+        ).filter(
+            LessonPlan.source_type == source_type,
+            LessonPlan.user_id == current_teacher.id
+        )
         
         if class_id:
-            sql_query += " AND class_id = :class_id"
-            params["class_id"] = class_id
+            query = query.filter(LessonPlan.class_id == class_id)
 
         if chapter_id:
-            # Filter by chapterId inside the content JSON
-            # SQLite uses json_extract, PostgreSQL uses ->>
-            # Assuming SQLite for now based on file extensions seen
-            
-            # Check if using SQLite or PostgreSQL
-            dialect = db.bind.dialect.name
-            if dialect == 'postgresql':
-                 sql_query += " AND CAST(content ->> 'chapterId' AS INTEGER) = :chapter_id"
-            else:
-                 # SQLite
-                 sql_query += " AND json_extract(content, '$.chapterId') = :chapter_id"
+            query = query.filter(LessonPlan.chapter_id == chapter_id)
             
-            params["chapter_id"] = chapter_id
-            
-        sql_query += " ORDER BY created_at DESC LIMIT :limit"
-        
-        query = text(sql_query)
-        result = db.execute(query, params)
-
-        rows = result.fetchall()
+        query, limit = pagination.paginate(query, LessonPlan.created_at, LessonPlan.id, cursor, limit)
+        rows, next_cursor = pagination.page_rows(query.all(), limit)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Database query error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
     # Return simplified history data
-    history = []
-    for row in rows:
-        try:
-            content_raw = row[2]  # content column (JSON string)
-
-            # Parse JSON string to dict
-            import json
-            if isinstance(content_raw, str):
-                try:
-                    content = json.loads(content_raw)
-                except json.JSONDecodeError:
-                    continue
-            else:
-                content = content_raw
-
-            # Ensure content is a dict
-            if isinstance(content, dict):
-                history_item = {
-                    "id": row[0],  # id
-                    "title": content.get("title", "Untitled"),
-                    "subject": content.get("subject", "Unknown"),
-                    "grade": content.get("grade", "Unknown"),
-                    "created_at": row[5].isoformat() if row[5] else None,  # created_at
-                    "source_url": row[3],  # source_url
-                    "source_type": row[4]  # source_type from database
-                }
-                history.append(history_item)
-        except Exception:
-            continue
+    history = [
+        {
+            "id": row.id,
+            "title": row.title or "Untitled",
+            "subject": row.subject or "Unknown",
+            "grade": row.grade if row.grade is not None else "Unknown",
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "source_url": row.source_url,
+            "source_type": row.source_type
+        }
+        for row in rows
+    ]
 
-    return {"history": history, "source_type": source_type}
+    return {"history": history, "source_type": source_type, "nextCursor": next_cursor}
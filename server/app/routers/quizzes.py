@@ -1,16 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, Union, List
-from ..database import get_db
-from ..models import Quiz, QuestionType, DifficultyLevel
+from ..database import get_db, SessionLocal
+from ..models import Quiz, QuestionType, DifficultyLevel, LessonPlan, Teacher
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from services.quiz_service import QuizGenerator
-from services.pdf_service import QuizPDFGenerator
+from services import pdf_cache
+from services.pdf_render_service import render_service
+from services.zip_stream import ZipStream
+from services.quiz_variants import build_variants
 from ..auth import get_current_teacher
-from datetime import datetime
+from .. import pagination
+from datetime import datetime, timezone, date, timedelta
+import asyncio
+import json
+import re
+from email.utils import format_datetime, parsedate_to_datetime
 
 router = APIRouter(prefix="/quizzes", tags=["quizzes"])
 
@@ -34,8 +45,37 @@ class QuizSaveRequest(BaseModel):
     questions_data: dict
     answer_key: Union[list, dict, None] = None
 
+class QuizVariantsRequest(BaseModel):
+    count: int = 2
+    seed: Optional[str] = None  # Defaults to the quiz id so papers are reproducible
+    layout: str = "booklet"  # "booklet" (one PDF) | "separate" (ZIP with one PDF per variant)
+
 quiz_generator = QuizGenerator()
-pdf_generator = QuizPDFGenerator()
+
+# Drop cached PDF renders whenever a quiz row changes or is removed
+@event.listens_for(Quiz, "after_update")
+@event.listens_for(Quiz, "after_delete")
+def _invalidate_quiz_pdf(mapper, connection, target):
+    pdf_cache.invalidate_quiz(target.id)
+
+def _is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against the current render."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return last_modified.replace(microsecond=0) <= since
+    return False
 
 @router.post("/generate")
 def generate_quiz(request: QuizGenerateRequest, current_teacher = Depends(get_current_teacher)):
@@ -108,25 +148,230 @@ def save_quiz(request: QuizSaveRequest, current_teacher = Depends(get_current_te
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to save quiz: {str(e)}")
 
+@router.get("/")
+def list_quizzes(
+    subject: Optional[str] = None,
+    grade: Optional[int] = None,
+    lesson_plan_id: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    current_teacher = Depends(get_current_teacher),
+    db: Session = Depends(get_db)
+):
+    """
+    List the teacher's quizzes, newest first. Questions are not loaded.
+    Pass the returned nextCursor as `cursor` to get the following page.
+    """
+    try:
+        query = db.query(
+            Quiz.id, Quiz.title, Quiz.topic, Quiz.subject, Quiz.grade,
+            Quiz.num_questions, Quiz.difficulty, Quiz.created_at
+        ).filter(Quiz.user_id == current_teacher.id)
+        if subject:
+            query = query.filter(Quiz.subject == subject)
+        if grade:
+            query = query.filter(Quiz.grade == grade)
+        if lesson_plan_id:
+            query = query.filter(Quiz.source_lesson_plan_id == lesson_plan_id)
+
+        query, limit = pagination.paginate(query, Quiz.created_at, Quiz.id, cursor, limit)
+        rows, next_cursor = pagination.page_rows(query.all(), limit)
+
+        return {
+            "quizzes": [
+                {
+                    "id": row.id,
+                    "title": row.title,
+                    "topic": row.topic,
+                    "subject": row.subject,
+                    "grade": row.grade,
+                    "num_questions": row.num_questions,
+                    "difficulty": row.difficulty.value if row.difficulty else None,
+                    "created_at": row.created_at.isoformat() if row.created_at else None
+                }
+                for row in rows
+            ],
+            "nextCursor": next_cursor
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list quizzes: {str(e)}")
+
+def _find_quizzes_for_export(db: Session, teacher_id: int, class_id: Optional[int], grade: Optional[int],
+                             subject: Optional[str], date_from: Optional[date], date_to: Optional[date], limit: int):
+    """Return lightweight (id, title, revision) tuples; questions are only loaded on cache misses."""
+    query = db.query(Quiz.id, Quiz.title, Quiz.updated_at, Quiz.created_at).filter(Quiz.user_id == teacher_id)
+    if class_id:
+        # Quizzes are linked to a class through the lesson plan they were generated from
+        lesson_plan_ids = db.query(LessonPlan.id).filter(LessonPlan.class_id == class_id)
+        query = query.filter(Quiz.source_lesson_plan_id.in_(lesson_plan_ids))
+    if grade:
+        query = query.filter(Quiz.grade == grade)
+    if subject:
+        query = query.filter(Quiz.subject == subject)
+    if date_from:
+        query = query.filter(Quiz.created_at >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.filter(Quiz.created_at < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    rows = query.order_by(Quiz.created_at, Quiz.id).limit(limit).all()
+    return [(row.id, row.title, row.updated_at or row.created_at) for row in rows]
+
+def _load_questions_data(quiz_id: int):
+    # Runs after the response has started, so it cannot use the request-scoped session
+    db = SessionLocal()
+    try:
+        row = db.query(Quiz.questions_data).filter(Quiz.id == quiz_id).first()
+        return row[0] if row else None
+    finally:
+        db.close()
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+async def _get_quiz_pdf(quiz_id: int, revision: Optional[datetime]) -> bytes:
+    """Cached render if available, otherwise render in the pool and cache it."""
+    pdf_path = pdf_cache.get_cached_pdf_path(quiz_id, revision)
+    if pdf_path:
+        try:
+            return await run_in_threadpool(_read_file, pdf_path)
+        except FileNotFoundError:
+            pass  # Evicted in between; render again
+
+    questions_data = await run_in_threadpool(_load_questions_data, quiz_id)
+    if questions_data is None:
+        raise ValueError("Quiz not found")
+    pdf_bytes = await render_service.render(questions_data)
+    await run_in_threadpool(pdf_cache.store_pdf, quiz_id, revision, pdf_bytes)
+    return pdf_bytes
+
+def _export_filename(quiz_id: int, title: Optional[str]) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", title or "quiz").strip("-")[:60] or "quiz"
+    return f"{slug}-{quiz_id}.pdf"
+
+async def _stream_quiz_zip(quizzes):
+    """
+    Yield ZIP bytes as each PDF completes. Renders run in parallel, but only
+    as many are kept in flight as the render pool accepts, so memory stays
+    constant regardless of how many quizzes are exported.
+    """
+    archive = ZipStream()
+    errors = []
+    window = max(1, render_service.max_pending)
+    remaining = iter(quizzes)
+    pending = {}
+
+    def schedule_next():
+        for quiz_id, title, revision in remaining:
+            task = asyncio.ensure_future(_get_quiz_pdf(quiz_id, revision))
+            pending[task] = (quiz_id, title)
+            return
+
+    try:
+        for _ in range(window):
+            schedule_next()
+
+        while pending:
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                quiz_id, title = pending.pop(task)
+                schedule_next()
+                try:
+                    pdf_bytes = task.result()
+                except Exception as e:
+                    errors.append(f"quiz {quiz_id}: {str(e)}")
+                    continue
+                yield archive.add(_export_filename(quiz_id, title), pdf_bytes)
+
+        if errors:
+            yield archive.add("errors.txt", "\n".join(errors).encode("utf-8"))
+        yield archive.close()
+    finally:
+        # Client went away: stop rendering the rest
+        for task in pending:
+            task.cancel()
+
+@router.get("/export-zip")
+async def export_quizzes_zip(
+    teacher_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    grade: Optional[int] = None,
+    subject: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = 500,
+    current_teacher: Teacher = Depends(get_current_teacher),
+    db: Session = Depends(get_db)
+):
+    """
+    Export every quiz matching the filter as a ZIP of PDFs, streamed while the
+    renders complete. Defaults to the current teacher's quizzes; another
+    teacher's quizzes can be exported by a teacher from the same school.
+    """
+    teacher_id = teacher_id or current_teacher.id
+    if teacher_id != current_teacher.id:
+        other = await run_in_threadpool(lambda: db.query(Teacher).filter(Teacher.id == teacher_id).first())
+        if not other or not current_teacher.school_id or other.school_id != current_teacher.school_id:
+            raise HTTPException(status_code=403, detail="Not allowed to export this teacher's quizzes")
+
+    try:
+        quizzes = await run_in_threadpool(
+            _find_quizzes_for_export, db, teacher_id, class_id, grade, subject, date_from, date_to, limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list quizzes: {str(e)}")
+
+    if not quizzes:
+        raise HTTPException(status_code=404, detail="No quizzes match the filter")
+
+    return StreamingResponse(
+        _stream_quiz_zip(quizzes),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=quizzes-{teacher_id}.zip"}
+    )
+
+def _load_quiz_for_export(db: Session, quiz_id: int):
+    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    return quiz
+
 @router.get("/{quiz_id}/export-pdf")
-def export_quiz_pdf(quiz_id: int, db: Session = Depends(get_db)):
+async def export_quiz_pdf(quiz_id: int, request: Request, db: Session = Depends(get_db)):
     """
     Generate and return PDF for a saved quiz.
+    Renders are cached on disk per quiz revision and served with ETag/Last-Modified,
+    so repeat downloads are a file read (or a 304) instead of a layout pass.
+    Cache misses are rendered in the PDF process pool.
     """
     try:
-        # Fetch quiz from database
-        quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
-        if not quiz:
-            raise HTTPException(status_code=404, detail="Quiz not found")
+        # Fetch quiz from database (blocking I/O stays off the event loop)
+        quiz = await run_in_threadpool(_load_quiz_for_export, db, quiz_id)
+
+        revision = quiz.updated_at or quiz.created_at
+        etag = pdf_cache.etag_for(quiz.id, revision)
+        last_modified = revision.replace(tzinfo=timezone.utc) if revision else None
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if last_modified:
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+        if _is_not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
 
-        # Generate PDF
-        pdf_bytes = pdf_generator.generate_pdf(quiz.questions_data)
+        pdf_path = pdf_cache.get_cached_pdf_path(quiz.id, revision)
+        if not pdf_path:
+            # Generate PDF
+            pdf_bytes = await render_service.render(quiz.questions_data)
+            pdf_path = await run_in_threadpool(pdf_cache.store_pdf, quiz.id, revision, pdf_bytes)
 
         # Return PDF as response
-        return Response(
-            content=pdf_bytes,
+        return FileResponse(
+            pdf_path,
             media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=quiz-{quiz_id}.pdf"}
+            filename=f"quiz-{quiz_id}.pdf",
+            headers=headers
         )
 
     except HTTPException:
@@ -134,6 +379,52 @@ def export_quiz_pdf(quiz_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate PDF: {str(e)}")
 
+@router.post("/{quiz_id}/variants")
+async def export_quiz_variants(quiz_id: int, request: QuizVariantsRequest, db: Session = Depends(get_db)):
+    """
+    Generate shuffled variants of a quiz (question order and MCQ options) with
+    remapped answer keys. Booklet layout renders every variant in one pass;
+    separate layout renders one PDF per variant in parallel and returns a ZIP.
+    """
+    if request.count < 1 or request.count > 100:
+        raise HTTPException(status_code=400, detail="count must be between 1 and 100")
+    if request.layout not in ("booklet", "separate"):
+        raise HTTPException(status_code=400, detail="layout must be 'booklet' or 'separate'")
+
+    try:
+        quiz = await run_in_threadpool(_load_quiz_for_export, db, quiz_id)
+        seed = request.seed if request.seed is not None else str(quiz.id)
+        variants = build_variants(quiz.questions_data, request.count, seed)
+
+        if request.layout == "booklet":
+            pdf_bytes = await render_service.render_booklet(variants)
+            return Response(
+                content=pdf_bytes,
+                media_type="application/pdf",
+                headers={"Content-Disposition": f"attachment; filename=quiz-{quiz_id}-variants.pdf"}
+            )
+
+        pdfs = await asyncio.gather(*(render_service.render(variant) for variant in variants))
+        archive = ZipStream()
+        chunks = []
+        for variant, pdf_bytes in zip(variants, pdfs):
+            name = variant["variant_label"].replace(" ", "-").lower()
+            chunks.append(archive.add(f"quiz-{quiz_id}-{name}.pdf", pdf_bytes))
+        answer_keys = {variant["variant_label"]: variant["answer_key"] for variant in variants}
+        chunks.append(archive.add("answer_keys.json", json.dumps(answer_keys, indent=2).encode("utf-8")))
+        chunks.append(archive.close())
+
+        return Response(
+            content=b"".join(chunks),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=quiz-{quiz_id}-variants.zip"}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate quiz variants: {str(e)}")
+
 @router.get("/{quiz_id}")
 def get_quiz(quiz_id: int, db: Session = Depends(get_db)):
     """
@@ -1,6 +1,16 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Response, Depends, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from services.tts_service import generate_speech
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models import LessonPlan
+from .. import lesson_plan_versions
+from services.tts_service import (
+    cache_speech, get_cached_speech_path, audio_id, audio_cache,
+    stream_speech_cached, stream_speech_long_form, generate_speech,
+    iter_teacher_scripts, use_long_form, presynthesize_lesson_plan, presynthesis_jobs
+)
+from typing import Optional
 import traceback
 
 router = APIRouter(
@@ -8,21 +18,141 @@ router = APIRouter(
     tags=["Text to Speech"]
 )
 
+class TTSVoiceRequest(BaseModel):
+    voice: str = "en-US-AriaNeural"
+    rate: str = "+0%"
+    pitch: str = "+0Hz"
+
 class TTSRequest(BaseModel):
     text: str
     voice: str = "en-US-AriaNeural"
     rate: str = "+0%"
     pitch: str = "+0Hz"
+    long_form: bool = False  # Split long scripts and synthesize the chunks concurrently
+
+def _long_form(request: TTSRequest) -> bool:
+    # Scripts over TTS_CHUNK_CHARS are always long-form, matching pre-synthesis and the manifest
+    return request.long_form or use_long_form(request.text)
+
+def _audio_response(path: str, clip_id: str, cache_status: str) -> FileResponse:
+    # FileResponse answers Range requests, so players can seek within the clip
+    return FileResponse(
+        path,
+        media_type="audio/mpeg",
+        headers={
+            "X-Audio-Url": f"{router.prefix}/audio/{clip_id}",
+            "X-TTS-Cache": cache_status,
+            "Cache-Control": "public, max-age=31536000, immutable"
+        }
+    )
 
 @router.post("/generate")
 async def generate_tts(request: TTSRequest):
     try:
         if not request.text:
             raise HTTPException(status_code=400, detail="Text is required")
-            
-        audio_data = await generate_speech(request.text, request.voice, request.rate, request.pitch)
-        return Response(content=audio_data, media_type="audio/mpeg")
+
+        long_form = _long_form(request)
+        clip_id = audio_id(request.text, request.voice, request.rate, request.pitch, long_form)
+        path = get_cached_speech_path(request.text, request.voice, request.rate, request.pitch, long_form)
+        cache_status = "hit"
+        if not path:
+            if audio_cache is None:
+                if long_form:
+                    audio_data = b"".join([chunk async for chunk in stream_speech_long_form(request.text, request.voice, request.rate, request.pitch)])
+                else:
+                    audio_data = await generate_speech(request.text, request.voice, request.rate, request.pitch)
+                return Response(content=audio_data, media_type="audio/mpeg")
+            path = await cache_speech(request.text, request.voice, request.rate, request.pitch, long_form)
+            cache_status = "miss"
+        return _audio_response(path, clip_id, cache_status)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"TTS Error: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/stream")
+async def stream_tts(request: TTSRequest):
+    """
+    Like /generate, but forwards MP3 chunks as soon as edge-tts produces them
+    instead of waiting for the whole clip. Cached clips are served from disk.
+    """
+    if not request.text:
+        raise HTTPException(status_code=400, detail="Text is required")
+
+    long_form = _long_form(request)
+    clip_id = audio_id(request.text, request.voice, request.rate, request.pitch, long_form)
+    path = get_cached_speech_path(request.text, request.voice, request.rate, request.pitch, long_form)
+    if path:
+        return _audio_response(path, clip_id, "hit")
+
+    return StreamingResponse(
+        stream_speech_cached(request.text, request.voice, request.rate, request.pitch, long_form),
+        media_type="audio/mpeg",
+        headers={"X-Audio-Url": f"{router.prefix}/audio/{clip_id}", "X-TTS-Cache": "miss"}
+    )
+
+@router.get("/audio/{clip_id}")
+async def get_tts_audio(clip_id: str):
+    """Serve a previously synthesized clip by its content address (supports Range)."""
+    path = audio_cache.get_path_by_id(clip_id) if audio_cache is not None else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return _audio_response(path, clip_id, "hit")
+
+def _load_lesson_plan_content(db: Session, lesson_plan_id: int):
+    lesson_plan = db.query(LessonPlan).filter(LessonPlan.id == lesson_plan_id).first()
+    if not lesson_plan:
+        raise HTTPException(status_code=404, detail="Lesson plan not found")
+    return lesson_plan_versions.resolve_content(db, lesson_plan) or {}
+
+@router.get("/lesson-plans/{lesson_plan_id}/manifest")
+def get_lesson_plan_audio_manifest(
+    lesson_plan_id: int,
+    voice: str = "en-US-AriaNeural",
+    rate: str = "+0%",
+    pitch: str = "+0Hz",
+    db: Session = Depends(get_db)
+):
+    """
+    Map every timeline item of a lesson plan to its audio URL and whether the
+    clip is already in the cache (see presynthesize).
+    """
+    content = _load_lesson_plan_content(db, lesson_plan_id)
+    items = []
+    for path, script in iter_teacher_scripts(content):
+        long_form = use_long_form(script)
+        clip_id = audio_id(script, voice, rate, pitch, long_form)
+        ready = audio_cache is not None and audio_cache.get_path_by_id(clip_id) is not None
+        items.append({
+            "path": path,
+            "ready": ready,
+            "url": f"{router.prefix}/audio/{clip_id}" if ready else None
+        })
+
+    return {
+        "lessonPlanId": lesson_plan_id,
+        "job": presynthesis_jobs.get(lesson_plan_id),
+        "ready": sum(1 for item in items if item["ready"]),
+        "total": len(items),
+        "items": items
+    }
+
+@router.post("/lesson-plans/{lesson_plan_id}/presynthesize")
+def queue_lesson_plan_presynthesis(
+    lesson_plan_id: int,
+    background_tasks: BackgroundTasks,
+    request: Optional[TTSVoiceRequest] = None,
+    db: Session = Depends(get_db)
+):
+    """Queue background synthesis of every teacherScript in a lesson plan."""
+    if audio_cache is None:
+        raise HTTPException(status_code=400, detail="TTS audio cache is disabled")
+    content = _load_lesson_plan_content(db, lesson_plan_id)
+    voice = request or TTSVoiceRequest()
+    presynthesis_jobs.set(lesson_plan_id, {"status": "queued"})
+    background_tasks.add_task(presynthesize_lesson_plan, lesson_plan_id, content, voice.voice, voice.rate, voice.pitch)
+    return {"lessonPlanId": lesson_plan_id, "status": "queued"}
@@ -0,0 +1,117 @@
+"""
+Per-request SQL statistics, replacing engine echo.
+
+instrument_engine() hooks an engine's cursor execution. While a request is
+being handled (SQLInstrumentationMiddleware), every statement is counted and
+timed against that request:
+
+- statements slower than SQL_SLOW_QUERY_MS are printed with their route;
+- the same SQL text run SQL_N_PLUS_ONE_THRESHOLD or more times in one request
+  (typically a lazy load in a loop) is reported as a possible N+1;
+- per-route statement counts and SQL time go to services.metrics (/metrics);
+- with SQL_DEBUG_HEADERS=true, responses carry X-SQL-Count, X-SQL-Time-Ms
+  and X-SQL-N-Plus-One.
+"""
+import os
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from services import metrics
+
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+SQL_DEBUG_HEADERS = os.getenv("SQL_DEBUG_HEADERS", "false").lower() == "true"
+# Statements are truncated to this many characters in log lines
+SQL_LOG_CHARS = 300
+
+
+class RequestSQLStats:
+    def __init__(self, label: str):
+        self.label = label  # "GET /path"; the route template replaces it once routing is done
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated(self):
+        """(statement, count) pairs at or above the N+1 threshold, most repeated first."""
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= SQL_N_PLUS_ONE_THRESHOLD]
+
+
+_current: ContextVar[Optional[RequestSQLStats]] = ContextVar("request_sql_stats", default=None)
+
+
+def current_stats() -> Optional[RequestSQLStats]:
+    return _current.get()
+
+
+def _shorten(statement: str) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= SQL_LOG_CHARS else statement[:SQL_LOG_CHARS] + "..."
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start_time"].pop()
+    metrics.increment("sql_statements")
+
+    stats = _current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+        stats.statements[statement] += 1
+
+    if seconds * 1000 >= SQL_SLOW_QUERY_MS:
+        metrics.increment("sql_slow_queries")
+        route = stats.label if stats is not None else "(no request)"
+        print(f"SLOW SQL: {seconds * 1000:.0f} ms in {route}: {_shorten(statement)}")
+
+
+def instrument_engine(engine) -> None:
+    """Count and time every statement run on this engine (idempotent)."""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_label(request) -> str:
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or request.url.path
+    return f"{request.method} {path}"
+
+
+def _report(stats: RequestSQLStats):
+    metrics.increment(f"sql_statements:{stats.label}", stats.count)
+    metrics.observe(f"sql_time:{stats.label}", stats.seconds)
+    for statement, count in stats.repeated():
+        metrics.increment("sql_n_plus_one")
+        print(f"WARNING: Possible N+1 in {stats.label}: {count}x {_shorten(statement)}")
+
+
+class SQLInstrumentationMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        stats = RequestSQLStats(f"{request.method} {request.url.path}")
+        token = _current.set(stats)
+        try:
+            response = await call_next(request)
+        finally:
+            _current.reset(token)
+
+        stats.label = _route_label(request)
+        if stats.count:
+            _report(stats)
+        if SQL_DEBUG_HEADERS:
+            response.headers["X-SQL-Count"] = str(stats.count)
+            response.headers["X-SQL-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+            response.headers["X-SQL-N-Plus-One"] = str(len(stats.repeated()))
+        return response
@@ -0,0 +1,147 @@
+"""
+Teaching progress writes and the per-class summary they maintain.
+
+Every TeachingProgress row is recorded through record_progress(), which writes
+one taught_subtopics row per subtopic (for SQL coverage queries) and folds it
+into the matching TeachingProgressSummary row in the same transaction, so
+reading a class's progress is one row per chapter instead of merging every
+lesson ever recorded.
+"""
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.chapter_index import SubTopic, TeachingProgress, TaughtSubtopic, TeachingProgressSummary
+
+
+def _chapter_subtopic_ids(db: Session, chapter_id: int) -> set:
+    return set(db.execute(select(SubTopic.id).where(SubTopic.chapter_id == chapter_id)).scalars())
+
+
+def _apply(summary: TeachingProgressSummary, subtopic_ids: Iterable[int], taught_at: Optional[datetime], chapter_subtopics: set):
+    taught = set(summary.subtopic_ids or []) | set(subtopic_ids)
+    summary.subtopic_ids = sorted(taught)
+    summary.taught_count = len(taught)
+    summary.total_subtopics = len(chapter_subtopics)
+    covered = len(taught & chapter_subtopics)
+    summary.coverage = round(100.0 * covered / len(chapter_subtopics), 1) if chapter_subtopics else 0.0
+    if taught_at and (summary.last_taught is None or taught_at > summary.last_taught):
+        summary.last_taught = taught_at
+
+
+def _locked_summary(db: Session, teacher_id: int, class_id: Optional[int], chapter_id: int) -> Optional[TeachingProgressSummary]:
+    return db.query(TeachingProgressSummary).filter(
+        TeachingProgressSummary.teacher_id == teacher_id,
+        TeachingProgressSummary.class_id == class_id,
+        TeachingProgressSummary.chapter_id == chapter_id
+    ).with_for_update().first()
+
+
+def update_summary(db: Session, teacher_id: int, class_id: Optional[int], chapter_id: int, subtopic_ids: List[int], taught_at: Optional[datetime] = None, chapter_subtopics: Optional[set] = None):
+    """Fold newly taught subtopics into the (teacher, class, chapter) summary (the caller commits)."""
+    if chapter_subtopics is None:
+        chapter_subtopics = _chapter_subtopic_ids(db, chapter_id)
+    summary = _locked_summary(db, teacher_id, class_id, chapter_id)
+    if summary is None:
+        summary = TeachingProgressSummary(teacher_id=teacher_id, class_id=class_id, chapter_id=chapter_id, subtopic_ids=[])
+        _apply(summary, subtopic_ids, taught_at, chapter_subtopics)
+        try:
+            with db.begin_nested():
+                db.add(summary)
+            return summary
+        except IntegrityError:
+            # Another request created it first; merge into theirs
+            summary = _locked_summary(db, teacher_id, class_id, chapter_id)
+    _apply(summary, subtopic_ids, taught_at, chapter_subtopics)
+    return summary
+
+
+def sync_taught_subtopics(db: Session, progress: TeachingProgress, chapter_subtopics: Optional[set] = None):
+    """
+    Make progress.taught_subtopics match its subtopic_ids JSON list.
+    Ids that are not subtopics of progress.chapter_id (unknown, or from another
+    chapter) stay in the JSON list but get no taught_subtopics row.
+    """
+    if chapter_subtopics is None:
+        chapter_subtopics = _chapter_subtopic_ids(db, progress.chapter_id)
+    progress.taught_subtopics = [
+        TaughtSubtopic(
+            subtopic_id=subtopic_id,
+            teacher_id=progress.teacher_id,
+            class_id=progress.class_id,
+            chapter_id=progress.chapter_id,
+            taught_at=progress.taught_at
+        )
+        for subtopic_id in dict.fromkeys(progress.subtopic_ids or [])
+        if subtopic_id in chapter_subtopics
+    ]
+
+
+def record_progress(db: Session, teacher_id: int, chapter_id: int, class_id: Optional[int], subtopic_ids: List[int], lesson_plan_id: Optional[int] = None) -> TeachingProgress:
+    """Add a TeachingProgress row and update its summary (the caller commits)."""
+    progress = TeachingProgress(
+        teacher_id=teacher_id,
+        chapter_id=chapter_id,
+        class_id=class_id,
+        subtopic_ids=subtopic_ids,
+        lesson_plan_id=lesson_plan_id,
+        taught_at=datetime.utcnow()
+    )
+    chapter_subtopics = _chapter_subtopic_ids(db, chapter_id)
+    sync_taught_subtopics(db, progress, chapter_subtopics)
+    db.add(progress)
+    update_summary(db, teacher_id, class_id, chapter_id, subtopic_ids, progress.taught_at, chapter_subtopics)
+    return progress
+
+
+def get_progress_summary(db: Session, teacher_id: int, class_id: int) -> List[Dict[str, Any]]:
+    summaries = db.query(TeachingProgressSummary).filter(
+        TeachingProgressSummary.teacher_id == teacher_id,
+        TeachingProgressSummary.class_id == class_id
+    ).all()
+    return [
+        {
+            "chapterId": summary.chapter_id,
+            "subtopicIds": summary.subtopic_ids,
+            "lastTaught": summary.last_taught.isoformat() if summary.last_taught else None,
+            "taughtCount": summary.taught_count,
+            "totalSubtopics": summary.total_subtopics,
+            "coverage": summary.coverage
+        }
+        for summary in summaries
+    ]
+
+
+def rebuild_summaries(db: Session, teacher_id: Optional[int] = None) -> int:
+    """
+    Recompute summaries from TeachingProgress (all teachers, or one).
+    Returns the number of summary rows written; the caller commits.
+    """
+    summaries = db.query(TeachingProgressSummary)
+    records = db.query(TeachingProgress)
+    if teacher_id is not None:
+        summaries = summaries.filter(TeachingProgressSummary.teacher_id == teacher_id)
+        records = records.filter(TeachingProgress.teacher_id == teacher_id)
+    summaries.delete(synchronize_session=False)
+
+    taught: Dict[tuple, set] = {}
+    last_taught: Dict[tuple, datetime] = {}
+    for record in records.order_by(TeachingProgress.id).yield_per(1000):
+        key = (record.teacher_id, record.class_id, record.chapter_id)
+        taught.setdefault(key, set()).update(record.subtopic_ids or [])
+        if record.taught_at and (key not in last_taught or record.taught_at > last_taught[key]):
+            last_taught[key] = record.taught_at
+
+    # Subtopics of every chapter involved, in one query
+    subtopics_by_chapter: Dict[int, set] = {}
+    if taught:
+        chapter_ids = {key[2] for key in taught}
+        for subtopic_id, chapter_id in db.query(SubTopic.id, SubTopic.chapter_id).filter(SubTopic.chapter_id.in_(chapter_ids)):
+            subtopics_by_chapter.setdefault(chapter_id, set()).add(subtopic_id)
+
+    for (teacher, class_id, chapter_id), subtopic_ids in taught.items():
+        summary = TeachingProgressSummary(teacher_id=teacher, class_id=class_id, chapter_id=chapter_id, subtopic_ids=[])
+        _apply(summary, subtopic_ids, last_taught.get((teacher, class_id, chapter_id)), subtopics_by_chapter.get(chapter_id, set()))
+        db.add(summary)
+    return len(taught)
@@ -0,0 +1,34 @@
+"""
+Database migration script to add the pre-serialized payload columns to chapter_indexes.
+This should be run from the server directory.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+from app.database import engine
+
+def run_migration():
+    """Add payload / payload_etag columns to chapter_indexes"""
+    print("Adding chapter index payload columns...")
+    
+    existing = {column["name"]: column["type"] for column in inspect(engine).get_columns("chapter_indexes")}
+    # TEXT is limited to 64 KB on MySQL; large syllabi need MEDIUMTEXT
+    payload_type = "MEDIUMTEXT" if engine.dialect.name == "mysql" else "TEXT"
+    with engine.begin() as connection:
+        if "payload" not in existing:
+            connection.execute(text(f"ALTER TABLE chapter_indexes ADD COLUMN payload {payload_type}"))
+        elif payload_type == "MEDIUMTEXT" and str(existing["payload"]).upper() == "TEXT":
+            # Widen a column created by an earlier run of this migration
+            connection.execute(text("ALTER TABLE chapter_indexes MODIFY COLUMN payload MEDIUMTEXT"))
+        if "payload_etag" not in existing:
+            connection.execute(text("ALTER TABLE chapter_indexes ADD COLUMN payload_etag VARCHAR(64)"))
+    
+    # Payloads are built lazily on the next read of each index
+    print("✓ Chapter index payload columns added successfully!")
+
+if __name__ == "__main__":
+    run_migration()
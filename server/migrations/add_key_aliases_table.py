@@ -0,0 +1,25 @@
+"""
+Database migration script to add the key_aliases table used to canonicalize
+chapter index subjects and boards.
+This should be run from the server directory.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.models import KeyAlias
+
+def run_migration():
+    """Create key_aliases table"""
+    print("Creating key_aliases table...")
+    
+    KeyAlias.__table__.create(bind=engine, checkfirst=True)
+    
+    print("✓ key_aliases table created successfully!")
+    print("  Run scripts/merge_chapter_indexes.py to consolidate existing duplicate indexes.")
+
+if __name__ == "__main__":
+    run_migration()
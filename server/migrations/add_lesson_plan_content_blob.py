@@ -0,0 +1,91 @@
+"""
+Database migration script to add compressed lesson plan storage: the
+lesson_plans.content_blob column and the content_dictionaries table.
+This should be run from the server directory:
+
+    python migrations/add_lesson_plan_content_blob.py                 # schema only
+    python migrations/add_lesson_plan_content_blob.py --convert zlib  # compress existing rows
+    python migrations/add_lesson_plan_content_blob.py --revert        # back to plain JSON
+
+Train a dictionary (scripts/train_content_dictionary.py) before converting;
+rows are compressed with the newest dictionary for the codec.
+"""
+import sys
+import os
+import argparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+from sqlalchemy import inspect, text, select, update, bindparam
+from app.database import engine
+from app.models import LessonPlan, ContentDictionary
+from app import content_codec
+
+BATCH_SIZE = 200
+
+def _add_schema():
+    existing = {column["name"] for column in inspect(engine).get_columns("lesson_plans")}
+    if "content_blob" not in existing:
+        blob_type = "MEDIUMBLOB" if engine.dialect.name == "mysql" else "BLOB"
+        with engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE lesson_plans ADD COLUMN content_blob {blob_type}"))
+    ContentDictionary.__table__.create(bind=engine, checkfirst=True)
+
+def _convert_rows(codec_name=None, revert=False):
+    """Rewrite rows in batches of BATCH_SIZE, walking the primary key. Returns (rows, bytes before, bytes after)."""
+    table = LessonPlan.__table__
+    codec = None if revert else content_codec.resolve_codec(codec_name)
+    pending = table.c.content_blob.is_not(None) if revert else table.c.content_blob.is_(None) & table.c.content.is_not(None)
+    statement = update(table).where(table.c.id == bindparam("plan_id")).values(
+        content=bindparam("json_content"), content_blob=bindparam("blob")
+    )
+    last_id = 0
+    total = before = after = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.content, table.c.content_blob)
+                .where(table.c.id > last_id, pending).order_by(table.c.id).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            params = []
+            for plan_id, content, blob in rows:
+                if revert:
+                    content = content_codec.decode(blob)
+                    before += len(blob)
+                    after += len(content_codec.dump_json(content))
+                    params.append({"plan_id": plan_id, "json_content": content, "blob": None})
+                else:
+                    if isinstance(content, str):
+                        content = json.loads(content)
+                    blob = content_codec.encode(content, codec)
+                    before += len(content_codec.dump_json(content))
+                    after += len(blob)
+                    params.append({"plan_id": plan_id, "json_content": None, "blob": blob})
+            connection.execute(statement, params)
+            last_id = rows[-1][0]
+            total += len(rows)
+    return total, before, after
+
+def run_migration(convert=None, revert=False):
+    """Add content_blob/content_dictionaries and optionally convert existing rows"""
+    print("Adding compressed lesson plan content storage...")
+    _add_schema()
+    
+    if convert or revert:
+        total, before, after = _convert_rows(convert, revert)
+        action = "Decompressed" if revert else "Compressed"
+        ratio = f" ({before / after:.1f}x)" if after and not revert else ""
+        print(f"{action} {total} lesson plans: {before / 1024:.0f} KB -> {after / 1024:.0f} KB{ratio}")
+    
+    print("✓ Compressed lesson plan content storage ready!")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add compressed lesson plan content storage")
+    parser.add_argument("--convert", choices=sorted(content_codec.CODEC_NAMES), help="Compress existing plain JSON rows with this codec")
+    parser.add_argument("--revert", action="store_true", help="Decompress all rows back to the plain JSON column")
+    args = parser.parse_args()
+    run_migration(convert=args.convert, revert=args.revert)
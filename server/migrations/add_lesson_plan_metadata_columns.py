@@ -0,0 +1,79 @@
+"""
+Database migration script to add the subject/grade/board/chapter_id/topic
+columns (and their indexes) to lesson_plans and backfill them from content.
+This should be run from the server directory.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+from sqlalchemy import inspect, text, select, update, bindparam
+from app.database import engine
+from app.models import LessonPlan
+from app import content_codec
+
+BATCH_SIZE = 500
+
+COLUMNS = {
+    "subject": "VARCHAR(100)",
+    "grade": "INTEGER",
+    "board": "VARCHAR(50)",
+    "chapter_id": "INTEGER",
+    "topic": "VARCHAR(255)",
+}
+
+def run_migration():
+    """Add lesson plan metadata columns and backfill them"""
+    print("Adding lesson plan metadata columns...")
+    
+    inspector = inspect(engine)
+    existing = {column["name"] for column in inspector.get_columns("lesson_plans")}
+    with engine.begin() as connection:
+        for name, sql_type in COLUMNS.items():
+            if name not in existing:
+                connection.execute(text(f"ALTER TABLE lesson_plans ADD COLUMN {name} {sql_type}"))
+    
+    existing_indexes = {index["name"] for index in inspect(engine).get_indexes("lesson_plans")}
+    for index in LessonPlan.__table__.indexes:
+        if index.name not in existing_indexes:
+            index.create(bind=engine)
+    
+    # Backfill in batches of BATCH_SIZE, walking the primary key
+    table = LessonPlan.__table__
+    statement = update(table).where(table.c.id == bindparam("plan_id")).values(
+        subject=bindparam("subject"), grade=bindparam("grade"), board=bindparam("board"),
+        chapter_id=bindparam("chapter_id"), topic=bindparam("topic")
+    )
+    # Compressed rows (migrations/add_lesson_plan_content_blob.py) keep content in content_blob
+    has_blob = "content_blob" in {column["name"] for column in inspect(engine).get_columns("lesson_plans")}
+    columns = [table.c.id, table.c.content] + ([table.c.content_blob] if has_blob else [])
+    last_id = 0
+    total = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(*columns).where(table.c.id > last_id).order_by(table.c.id).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            params = []
+            for plan_id, content, *blob in rows:
+                if blob and blob[0] is not None:
+                    content = content_codec.decode(blob[0])
+                elif isinstance(content, str):
+                    try:
+                        content = json.loads(content)
+                    except json.JSONDecodeError:
+                        content = None
+                params.append({"plan_id": plan_id, **LessonPlan.metadata_from_content(content)})
+            connection.execute(statement, params)
+            last_id = rows[-1][0]
+            total += len(rows)
+    
+    print(f"✓ Lesson plan metadata columns added and backfilled ({total} plans)!")
+
+if __name__ == "__main__":
+    run_migration()
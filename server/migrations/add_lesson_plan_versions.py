@@ -0,0 +1,46 @@
+"""
+Database migration script to add version columns (parent_id, root_id,
+version, patch_data) to lesson_plans for delta-stored tweaks.
+This should be run from the server directory.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+from app.database import engine
+from app.models import LessonPlan
+
+COLUMNS = {
+    "parent_id": "INTEGER",
+    "root_id": "INTEGER",
+    "version": "INTEGER NOT NULL DEFAULT 1",
+    "patch_data": "JSON",
+}
+
+def run_migration():
+    """Add lesson plan version columns"""
+    print("Adding lesson plan version columns...")
+    
+    existing = {column["name"] for column in inspect(engine).get_columns("lesson_plans")}
+    with engine.begin() as connection:
+        for name, sql_type in COLUMNS.items():
+            if name not in existing:
+                connection.execute(text(f"ALTER TABLE lesson_plans ADD COLUMN {name} {sql_type}"))
+        if engine.dialect.name == "mysql" and "parent_id" not in existing:
+            connection.execute(text(
+                "ALTER TABLE lesson_plans ADD CONSTRAINT fk_lesson_plans_parent "
+                "FOREIGN KEY (parent_id) REFERENCES lesson_plans (id)"
+            ))
+    
+    existing_indexes = {index["name"] for index in inspect(engine).get_indexes("lesson_plans")}
+    for index in LessonPlan.__table__.indexes:
+        if index.name not in existing_indexes:
+            index.create(bind=engine)
+    
+    print("✓ Lesson plan version columns added successfully!")
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,38 @@
+"""
+Database migration script to add the composite indexes used by keyset
+pagination of lesson plan history and quiz listings.
+This should be run from the server directory.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect
+from app.database import engine
+from app.models import LessonPlan, Quiz
+
+INDEXES = [
+    (LessonPlan.__table__, "ix_lesson_plans_user_source_created"),
+    (Quiz.__table__, "ix_quizzes_user_created"),
+]
+
+def run_migration():
+    """Create the (…, created_at, id) listing indexes"""
+    print("Adding listing pagination indexes...")
+    
+    inspector = inspect(engine)
+    for table, name in INDEXES:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        if name in existing:
+            print(f"  {name} already exists")
+            continue
+        index = next(index for index in table.indexes if index.name == name)
+        index.create(bind=engine)
+        print(f"  created {name}")
+    
+    print("✓ Listing pagination indexes added successfully!")
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,61 @@
+"""
+Database migration script to add the taught_subtopics table and backfill it
+from the teaching_progress.subtopic_ids JSON column.
+This should be run from the server directory.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, insert, delete
+from app.database import engine
+from app.models import TeachingProgress, TaughtSubtopic, SubTopic
+
+BATCH_SIZE = 1000
+
+def run_migration():
+    """Create taught_subtopics table and backfill it"""
+    print("Creating taught_subtopics table...")
+    
+    TaughtSubtopic.__table__.create(bind=engine, checkfirst=True)
+    
+    progress = TeachingProgress.__table__
+    taught = TaughtSubtopic.__table__
+    with engine.begin() as connection:
+        # Re-running the backfill starts from scratch
+        connection.execute(delete(taught))
+        
+        # Only subtopics that still exist (the JSON column has no foreign key)
+        existing = set(connection.execute(select(SubTopic.__table__.c.id)).scalars())
+        
+        rows = []
+        total = 0
+        for record in connection.execute(select(
+            progress.c.id, progress.c.teacher_id, progress.c.class_id,
+            progress.c.chapter_id, progress.c.subtopic_ids, progress.c.taught_at
+        ).order_by(progress.c.id)):
+            for subtopic_id in dict.fromkeys(record.subtopic_ids or []):
+                if subtopic_id not in existing:
+                    continue
+                rows.append({
+                    "progress_id": record.id,
+                    "subtopic_id": subtopic_id,
+                    "teacher_id": record.teacher_id,
+                    "class_id": record.class_id,
+                    "chapter_id": record.chapter_id,
+                    "taught_at": record.taught_at
+                })
+            if len(rows) >= BATCH_SIZE:
+                connection.execute(insert(taught), rows)
+                total += len(rows)
+                rows = []
+        if rows:
+            connection.execute(insert(taught), rows)
+            total += len(rows)
+    
+    print(f"✓ taught_subtopics created and backfilled ({total} rows)!")
+
+if __name__ == "__main__":
+    run_migration()
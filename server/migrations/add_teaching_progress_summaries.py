@@ -0,0 +1,32 @@
+"""
+Database migration script to add the teaching_progress_summaries table and
+fill it from existing teaching progress.
+This should be run from the server directory.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine, SessionLocal
+from app.models import TeachingProgressSummary
+from app.teaching_progress import rebuild_summaries
+
+def run_migration():
+    """Create teaching_progress_summaries table and backfill it"""
+    print("Creating teaching_progress_summaries table...")
+    
+    TeachingProgressSummary.__table__.create(bind=engine, checkfirst=True)
+    
+    db = SessionLocal()
+    try:
+        count = rebuild_summaries(db)
+        db.commit()
+    finally:
+        db.close()
+    
+    print(f"✓ teaching_progress_summaries created and backfilled ({count} rows)!")
+
+if __name__ == "__main__":
+    run_migration()
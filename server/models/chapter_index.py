@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, Float, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -13,9 +14,11 @@ class ChapterIndex(Base):
     grade = Column(Integer, nullable=False)
     board = Column(String(50), nullable=False)  # CBSE, ICSE, State Board, etc.
     generated_at = Column(DateTime, default=datetime.utcnow)
+    payload = Column(Text().with_variant(mysql.MEDIUMTEXT(), "mysql"), nullable=True)  # Pre-serialized API response (MEDIUMTEXT on MySQL); NULL when chapters changed
+    payload_etag = Column(String(64), nullable=True)
     
     # Relationships
-    chapters = relationship("Chapter", back_populates="index", cascade="all, delete-orphan")
+    chapters = relationship("Chapter", back_populates="index", cascade="all, delete-orphan", order_by="Chapter.chapter_number")
     
     # Unique constraint: one index per subject/grade/board
     __table_args__ = (UniqueConstraint('subject', 'grade', 'board', name='_subject_grade_board_uc'),)
@@ -33,7 +36,7 @@ class Chapter(Base):
     
     # Relationships
     index = relationship("ChapterIndex", back_populates="chapters")
-    subtopics = relationship("SubTopic", back_populates="chapter", cascade="all, delete-orphan")
+    subtopics = relationship("SubTopic", back_populates="chapter", cascade="all, delete-orphan", order_by="SubTopic.subtopic_number")
     teaching_records = relationship("TeachingProgress", back_populates="chapter")
 
 
@@ -68,3 +71,60 @@ class TeachingProgress(Base):
     chapter = relationship("Chapter", back_populates="teaching_records")
     class_ = relationship("Class")
     lesson_plan = relationship("LessonPlan")
+    taught_subtopics = relationship("TaughtSubtopic", back_populates="progress", cascade="all, delete-orphan")
+
+
+class TaughtSubtopic(Base):
+    """One row per subtopic of a TeachingProgress record, so coverage can be aggregated in SQL"""
+    __tablename__ = "taught_subtopics"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    progress_id = Column(Integer, ForeignKey("teaching_progress.id", ondelete="CASCADE"), nullable=False)
+    subtopic_id = Column(Integer, ForeignKey("subtopics.id"), nullable=False)
+    # Copied from the progress record so aggregates need no join
+    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    class_id = Column(Integer, ForeignKey("classes.id"), nullable=True)
+    chapter_id = Column(Integer, ForeignKey("chapters.id"), nullable=False)
+    taught_at = Column(DateTime, nullable=True)
+    
+    progress = relationship("TeachingProgress", back_populates="taught_subtopics")
+    
+    __table_args__ = (
+        UniqueConstraint('progress_id', 'subtopic_id', name='_progress_subtopic_uc'),
+        Index('ix_taught_subtopics_teacher_class', 'teacher_id', 'class_id'),
+        Index('ix_taught_subtopics_chapter', 'chapter_id'),
+        Index('ix_taught_subtopics_subtopic', 'subtopic_id'),
+    )
+
+
+class TeachingProgressSummary(Base):
+    """Per (teacher, class, chapter) roll-up of TeachingProgress, kept up to date on every write"""
+    __tablename__ = "teaching_progress_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    class_id = Column(Integer, ForeignKey("classes.id"), nullable=True)
+    chapter_id = Column(Integer, ForeignKey("chapters.id"), nullable=False)
+    subtopic_ids = Column(JSON, nullable=False)  # Sorted, de-duplicated subtopic IDs taught so far
+    taught_count = Column(Integer, nullable=False, default=0)
+    total_subtopics = Column(Integer, nullable=False, default=0)
+    coverage = Column(Float, nullable=False, default=0.0)  # Percentage of the chapter's subtopics taught
+    last_taught = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        UniqueConstraint('teacher_id', 'class_id', 'chapter_id', name='_teacher_class_chapter_uc'),
+        Index('ix_progress_summary_teacher_class', 'teacher_id', 'class_id'),
+    )
+
+
+class KeyAlias(Base):
+    """Maps a normalized subject/board spelling to its canonical chapter-index key"""
+    __tablename__ = "key_aliases"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    kind = Column(String(20), nullable=False)  # "subject" or "board"
+    alias = Column(String(255), nullable=False)  # Normalized form, see app/curriculum_keys.py
+    canonical = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (UniqueConstraint('kind', 'alias', name='_kind_alias_uc'),)
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, Enum, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Enum, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from enum import Enum as PyEnum
+from datetime import datetime
 from database import Base
 
 class QuestionType(str, PyEnum):
@@ -37,7 +38,12 @@ class Quiz(Base):
     source_lesson_plan_id = Column(Integer, nullable=True)  # Link to 2.3.1
 
     created_at = Column(DateTime)
-    updated_at = Column(DateTime)
+    updated_at = Column(DateTime, onupdate=datetime.utcnow)  # Drives PDF cache invalidation
+
+    __table_args__ = (
+        # Quiz listing pages: WHERE user_id ORDER BY created_at DESC, id DESC
+        Index('ix_quizzes_user_created', 'user_id', 'created_at', 'id'),
+    )
 
 class QuizResponse(Base):
     """Track student submissions (optional, for future grading feature)"""
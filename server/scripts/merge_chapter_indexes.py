@@ -0,0 +1,185 @@
+"""
+Consolidate chapter indexes whose subject/board spell the same canonical key
+(e.g. "science " / "General Science", "cbse" / "CBSE") into one index.
+This should be run from the server directory:
+
+    python scripts/merge_chapter_indexes.py                 # dry run, prints the plan
+    python scripts/merge_chapter_indexes.py --apply
+    python scripts/merge_chapter_indexes.py --alias subject "Gen Sci=Science" --apply
+
+For every group, the index already stored under the canonical key survives
+(otherwise the one with the most teaching progress). Chapters and subtopics of
+the duplicates are matched to the survivor's by number; teaching progress and
+chapter-mode lesson plans are re-pointed to the survivor's ids, and chapters or
+subtopics the survivor lacks are moved over instead of deleted. Teaching
+progress summaries are rebuilt afterwards.
+"""
+import sys
+import os
+import argparse
+from collections import defaultdict
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from app.database import SessionLocal
+from app.models import LessonPlan
+from app import curriculum_keys
+from app.teaching_progress import rebuild_summaries, sync_taught_subtopics
+from models.chapter_index import ChapterIndex, Chapter, TeachingProgress, TeachingProgressSummary
+
+
+def _progress_counts(db):
+    rows = db.query(Chapter.index_id, func.count(TeachingProgress.id)).join(
+        TeachingProgress, TeachingProgress.chapter_id == Chapter.id
+    ).group_by(Chapter.index_id).all()
+    return dict(rows)
+
+
+def plan_merges(db):
+    """Return [(canonical key, survivor, [duplicates])] for keys that need work."""
+    indexes = db.query(ChapterIndex).options(
+        selectinload(ChapterIndex.chapters).selectinload(Chapter.subtopics)
+    ).order_by(ChapterIndex.id).all()
+    progress = _progress_counts(db)
+
+    groups = defaultdict(list)
+    for index in indexes:
+        groups[curriculum_keys.canonical_key(index.subject, index.grade, index.board, db)].append(index)
+
+    plan = []
+    for key, members in groups.items():
+        survivor = max(members, key=lambda i: ((i.subject, i.grade, i.board) == key, progress.get(i.id, 0), -i.id))
+        duplicates = [i for i in members if i is not survivor]
+        if duplicates or (survivor.subject, survivor.grade, survivor.board) != key:
+            plan.append((key, survivor, duplicates))
+    return plan
+
+
+def merge_into(db, survivor, duplicate):
+    """Fold one duplicate index into the survivor. Returns (chapter id map, subtopic id map)."""
+    chapter_map = {}
+    subtopic_map = {}
+    survivor_chapters = {chapter.chapter_number: chapter for chapter in survivor.chapters}
+
+    for chapter in list(duplicate.chapters):
+        target = survivor_chapters.get(chapter.chapter_number)
+        if target is None:
+            # Survivor has no such chapter: move it with its subtopics
+            duplicate.chapters.remove(chapter)
+            survivor.chapters.append(chapter)
+            survivor_chapters[chapter.chapter_number] = chapter
+            continue
+
+        chapter_map[chapter.id] = target.id
+        target_subtopics = {st.subtopic_number: st for st in target.subtopics}
+        for subtopic in list(chapter.subtopics):
+            target_subtopic = target_subtopics.get(subtopic.subtopic_number)
+            if target_subtopic is None:
+                chapter.subtopics.remove(subtopic)
+                target.subtopics.append(subtopic)
+                target_subtopics[subtopic.subtopic_number] = subtopic
+            else:
+                subtopic_map[subtopic.id] = target_subtopic.id
+
+    return chapter_map, subtopic_map
+
+
+def remap_references(db, chapter_map, subtopic_map):
+    """
+    Point teaching progress and chapter-mode lesson plans at the surviving ids.
+    Summaries of the matched chapters are deleted (they would block deleting
+    the duplicate); run_merge rebuilds all summaries at the end.
+    """
+    if not chapter_map:
+        return 0, 0
+
+    records = db.query(TeachingProgress).filter(TeachingProgress.chapter_id.in_(chapter_map)).all()
+    for record in records:
+        record.chapter_id = chapter_map[record.chapter_id]
+        record.subtopic_ids = [subtopic_map.get(sid, sid) for sid in record.subtopic_ids or []]
+        sync_taught_subtopics(db, record)
+
+    db.query(TeachingProgressSummary).filter(
+        TeachingProgressSummary.chapter_id.in_(chapter_map)
+    ).delete(synchronize_session=False)
+
+    plans = 0
+    for lesson_plan in db.query(LessonPlan).filter(LessonPlan.source_type == "lesson").all():
+        content = lesson_plan.content or {}
+        if content.get("chapterId") in chapter_map:
+            content["chapterId"] = chapter_map[content["chapterId"]]
+            content["subtopicIds"] = [subtopic_map.get(sid, sid) for sid in content.get("subtopicIds") or []]
+            lesson_plan.content = content
+            plans += 1
+
+    return len(records), plans
+
+
+def run_merge(apply=False, aliases=None):
+    db = SessionLocal()
+    try:
+        for kind, alias, canonical in aliases or []:
+            curriculum_keys.add_alias(db, kind, alias, canonical)
+            print(f"Alias ({kind}): {alias!r} -> {canonical!r}")
+        db.flush()
+
+        plan = plan_merges(db)
+        if not plan:
+            print("✓ No duplicate chapter indexes found")
+            db.commit()
+            return
+
+        for (subject, grade, board), survivor, duplicates in plan:
+            print(f"{subject} Grade {grade} {board}: keep index {survivor.id} "
+                  f"({survivor.subject!r}, {survivor.board!r}), merge {[d.id for d in duplicates]}")
+            for duplicate in duplicates:
+                chapter_map, subtopic_map = merge_into(db, survivor, duplicate)
+                db.flush()
+                progress, plans = remap_references(db, chapter_map, subtopic_map)
+                # Write the re-pointed chapter_ids first; otherwise deleting the
+                # duplicate reloads its chapters' teaching_records and nulls them
+                db.flush()
+                db.delete(duplicate)
+                print(f"  index {duplicate.id}: {len(chapter_map)} chapters matched, "
+                      f"{progress} progress records and {plans} lesson plans re-pointed")
+            db.flush()
+            survivor.subject, survivor.grade, survivor.board = subject, grade, board
+            # The stored response names the old key; rebuilt on next read
+            survivor.payload = None
+            survivor.payload_etag = None
+
+        # Chapter ids and subtopic counts changed under the merged keys
+        db.flush()
+        rebuild_summaries(db)
+
+        if apply:
+            db.commit()
+            print(f"✓ Merged {len(plan)} chapter index keys")
+        else:
+            db.rollback()
+            print("Dry run only; re-run with --apply to write these changes")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _parse_alias(kind, mapping):
+    if "=" not in mapping:
+        raise argparse.ArgumentTypeError("alias must be ALIAS=CANONICAL")
+    alias, canonical = mapping.split("=", 1)
+    return kind, alias.strip(), canonical.strip()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge chapter indexes that share a canonical subject/grade/board")
+    parser.add_argument("--apply", action="store_true", help="Write changes (default is a dry run)")
+    parser.add_argument("--alias", nargs=2, action="append", default=[], metavar=("KIND", "ALIAS=CANONICAL"),
+                        help='Add an alias before merging, e.g. --alias subject "Gen Sci=Science"')
+    args = parser.parse_args()
+
+    run_merge(apply=args.apply, aliases=[_parse_alias(kind, mapping) for kind, mapping in args.alias])
@@ -0,0 +1,255 @@
+"""
+Pre-generate chapter indexes for a matrix of boards, grades and subjects so
+teachers never wait on Gemini the first time they open a planner.
+This should be run from the server directory, e.g.
+
+    python scripts/prewarm_chapter_indexes.py --boards CBSE ICSE --grades 1-10 \
+        --subjects Mathematics Science English --concurrency 4 --rate 20
+
+Indexes that already exist are skipped. Progress is written to a checkpoint
+file after every combination; --resume skips combinations it lists as done.
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app.database import SessionLocal
+from app import models  # Registers all mappers
+from app import chapter_index_store, curriculum_keys
+from models.chapter_index import ChapterIndex
+from services import llm_service
+
+DEFAULT_CHECKPOINT = "prewarm_checkpoint.json"
+
+
+def parse_grades(values):
+    """Accept grades as "1-5", "7" or "1-5,8,10"."""
+    grades = []
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                start, end = part.split("-", 1)
+                grades.extend(range(int(start), int(end) + 1))
+            else:
+                grades.append(int(part))
+    return sorted(set(grades))
+
+
+def combination_key(board, grade, subject):
+    return f"{board}|{grade}|{subject}"
+
+
+class RateLimiter:
+    """
+    Allow at most `per_minute` calls to start per minute and `concurrency`
+    calls in flight, across threads. Used as a context manager around each
+    Gemini request (llm_service enters it for every call, chunked ones included).
+    """
+
+    def __init__(self, per_minute, concurrency):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def __enter__(self):
+        self._slots.acquire()
+        try:
+            self.wait()
+        except BaseException:
+            self._slots.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self._slots.release()
+        return False
+
+
+class Checkpoint:
+    """JSON file of finished and failed combinations, rewritten atomically."""
+
+    def __init__(self, path, resume):
+        self.path = path
+        self.data = {"done": [], "failed": {}}
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+        self._lock = threading.Lock()
+
+    def is_done(self, key):
+        return key in self.data["done"]
+
+    def record(self, key, error=None):
+        with self._lock:
+            if error:
+                self.data["failed"][key] = error
+            else:
+                self.data["failed"].pop(key, None)
+                if key not in self.data["done"]:
+                    self.data["done"].append(key)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def existing_combinations():
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(ChapterIndex.board, ChapterIndex.grade, ChapterIndex.subject)).all()
+        return {combination_key(board, grade, subject) for board, grade, subject in rows}
+    finally:
+        db.close()
+
+
+def prewarm_one(board, grade, subject, limiter, retries, chunked=False):
+    """Generate and store one index. Returns (status, seconds, usage)."""
+    usage = {}
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            if chunked:
+                index_data = llm_service.generate_chapter_index_chunked(subject, grade, board, usage=usage, limiter=limiter)
+            else:
+                index_data = llm_service.generate_chapter_index(subject, grade, board, usage=usage, limiter=limiter)
+            break
+        except ValueError:
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt * 5)
+    seconds = time.perf_counter() - started
+
+    db = SessionLocal()
+    try:
+        new_index, chapters_data = chapter_index_store.persist_chapter_index(db, subject, grade, board, index_data)
+        db.commit()
+        chapter_index_store.store_payload(db, new_index, chapters_data)
+        return "generated", seconds, usage
+    except IntegrityError:
+        # A teacher's request generated it while we were waiting on Gemini
+        db.rollback()
+        return "existing", seconds, usage
+    finally:
+        db.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_prewarm(boards, grades, subjects, concurrency=4, rate=30.0, checkpoint_path=DEFAULT_CHECKPOINT, resume=False, retries=2, dry_run=False, chunked=False):
+    checkpoint = Checkpoint(checkpoint_path, resume)
+    existing = existing_combinations()
+
+    # Canonical spellings, so "maths" and "Mathematics" are one combination
+    db = SessionLocal()
+    try:
+        boards = list(dict.fromkeys(curriculum_keys.canonical_value(curriculum_keys.BOARD, b, db) for b in boards))
+        subjects = list(dict.fromkeys(curriculum_keys.canonical_value(curriculum_keys.SUBJECT, s, db) for s in subjects))
+    finally:
+        db.close()
+
+    pending = []
+    skipped = 0
+    for board in boards:
+        for grade in grades:
+            for subject in subjects:
+                key = combination_key(board, grade, subject)
+                if key in existing or checkpoint.is_done(key):
+                    skipped += 1
+                else:
+                    pending.append((board, grade, subject))
+
+    print(f"Chapter index pre-warm: {len(pending)} to generate, {skipped} already stored")
+    if dry_run:
+        for board, grade, subject in pending:
+            print(f"  would generate {subject} Grade {grade} {board}")
+        return
+
+    limiter = RateLimiter(rate, concurrency)
+    latencies = []
+    tokens = {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0}
+    counts = {"generated": 0, "existing": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(prewarm_one, board, grade, subject, limiter, retries, chunked): (board, grade, subject)
+            for board, grade, subject in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            board, grade, subject = futures[future]
+            key = combination_key(board, grade, subject)
+            try:
+                status, seconds, usage = future.result()
+            except Exception as e:
+                counts["failed"] += 1
+                checkpoint.record(key, error=str(e))
+                print(f"[{done}/{len(pending)}] ✗ {subject} Grade {grade} {board}: {str(e)}")
+                continue
+
+            counts[status] += 1
+            latencies.append(seconds)
+            for name in tokens:
+                tokens[name] += usage.get(name, 0)
+            checkpoint.record(key)
+            print(f"[{done}/{len(pending)}] ✓ {subject} Grade {grade} {board} ({status}, {seconds:.1f}s, {usage.get('totalTokenCount', 0)} tokens)")
+
+    print("\nSummary")
+    print(f"  generated: {counts['generated']}, already existed: {counts['existing']}, failed: {counts['failed']}, skipped: {skipped}")
+    if latencies:
+        print(f"  latency: p50 {percentile(latencies, 0.5):.1f}s, p95 {percentile(latencies, 0.95):.1f}s, max {max(latencies):.1f}s")
+    print(f"  tokens: prompt {tokens['promptTokenCount']}, output {tokens['candidatesTokenCount']}, total {tokens['totalTokenCount']}")
+    if counts["failed"]:
+        print(f"  failed combinations are listed in {checkpoint_path}; re-run with --resume to retry them")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate chapter indexes for boards x grades x subjects")
+    parser.add_argument("--boards", nargs="+", required=True, help="Education boards, e.g. CBSE ICSE")
+    parser.add_argument("--grades", nargs="+", required=True, help="Grades, e.g. 1-10 or 6 7 8")
+    parser.add_argument("--subjects", nargs="+", required=True, help="Subjects, e.g. Mathematics Science")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum Gemini calls in flight (default 4)")
+    parser.add_argument("--rate", type=float, default=30.0, help="Maximum Gemini calls started per minute (default 30)")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per combination on Gemini errors (default 2)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help=f"Checkpoint file (default {DEFAULT_CHECKPOINT})")
+    parser.add_argument("--resume", action="store_true", help="Skip combinations the checkpoint lists as done")
+    parser.add_argument("--chunked", action="store_true", help="Generate chapter list first, then subtopics in parallel chunks")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the combinations that would be generated")
+    args = parser.parse_args()
+
+    run_prewarm(
+        boards=args.boards,
+        grades=parse_grades(args.grades),
+        subjects=args.subjects,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        checkpoint_path=args.checkpoint,
+        resume=args.resume,
+        retries=args.retries,
+        dry_run=args.dry_run,
+        chunked=args.chunked
+    )
@@ -0,0 +1,39 @@
+"""
+Recompute teaching_progress_summaries from the teaching_progress log, e.g.
+after a bulk import or after chapters/subtopics were edited.
+This should be run from the server directory:
+
+    python scripts/rebuild_teaching_progress_summaries.py [--teacher-id 12]
+"""
+import sys
+import os
+import argparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app import models  # Registers all mappers
+from app.teaching_progress import rebuild_summaries
+
+
+def run_rebuild(teacher_id=None):
+    db = SessionLocal()
+    try:
+        count = rebuild_summaries(db, teacher_id)
+        db.commit()
+        scope = f"teacher {teacher_id}" if teacher_id is not None else "all teachers"
+        print(f"✓ Rebuilt {count} teaching progress summaries for {scope}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild teaching progress summaries")
+    parser.add_argument("--teacher-id", type=int, default=None, help="Only rebuild this teacher's summaries")
+    args = parser.parse_args()
+
+    run_rebuild(args.teacher_id)
@@ -0,0 +1,120 @@
+"""
+Train a shared compression dictionary from stored lesson plans and save it to
+content_dictionaries, where app/content_codec.py picks it up for new writes.
+This should be run from the server directory:
+
+    python scripts/train_content_dictionary.py --codec zlib --samples 1000
+    python scripts/train_content_dictionary.py --codec zstd --size 65536 --dry-run
+
+zstd dictionaries are trained with zstandard; zlib dictionaries are built from
+the JSON keys and phrases that recur across the most plans (zlib only uses the
+last 32 KB). Older dictionaries are kept because existing rows reference them.
+"""
+import sys
+import os
+import re
+import argparse
+from collections import Counter
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.models import LessonPlan, ContentDictionary
+from app import content_codec
+
+# "key": prefixes and short string values, as they appear in compact JSON
+_KEY_PATTERN = re.compile(r'"[A-Za-z_]{2,40}":')
+_VALUE_PATTERN = re.compile(r':"([^"\\]{4,120})"')
+_WORD_PATTERN = re.compile(r"\S+")
+PHRASE_WORDS = 4
+
+
+def load_samples(db, count):
+    plans = db.query(LessonPlan).order_by(LessonPlan.id.desc()).limit(count).all()
+    return [content_codec.dump_json(plan.content) for plan in plans if plan.content]
+
+
+def _fragments(sample: str):
+    fragments = set(_KEY_PATTERN.findall(sample))
+    for value in _VALUE_PATTERN.findall(sample):
+        fragments.add(f'"{value}"')
+        words = _WORD_PATTERN.findall(value)
+        for i in range(len(words) - PHRASE_WORDS + 1):
+            fragments.add(" ".join(words[i:i + PHRASE_WORDS]) + " ")
+    return fragments
+
+
+def build_zlib_dictionary(samples, size):
+    """Fragments that occur in at least two plans, best (plans x length) last where zlib finds them cheapest."""
+    document_frequency = Counter()
+    for sample in samples:
+        document_frequency.update(_fragments(sample.decode("utf-8")))
+
+    ranked = sorted(
+        (fragment for fragment, count in document_frequency.items() if count >= 2),
+        key=lambda fragment: document_frequency[fragment] * len(fragment),
+        reverse=True
+    )
+    chosen = []
+    used = 0
+    for fragment in ranked:
+        encoded = fragment.encode("utf-8")
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+def build_dictionary(samples, codec, size):
+    if codec == content_codec.CODEC_ZSTD:
+        return content_codec.zstandard.train_dictionary(size, samples).as_bytes()
+    return build_zlib_dictionary(samples, min(size, content_codec.ZLIB_MAX_DICT_BYTES))
+
+
+def evaluate(samples, codec, dictionary):
+    raw = sum(len(sample) for sample in samples)
+    plain = sum(len(content_codec.compress(sample, codec, None)) for sample in samples)
+    with_dictionary = sum(len(content_codec.compress(sample, codec, dictionary)) for sample in samples)
+    return raw, plain, with_dictionary
+
+
+def run_training(codec_name="zlib", sample_count=1000, size=32 * 1024, dry_run=False):
+    codec = content_codec.resolve_codec(codec_name)
+    codec_name = "zstd" if codec == content_codec.CODEC_ZSTD else "zlib"
+    db = SessionLocal()
+    try:
+        samples = load_samples(db, sample_count)
+        if len(samples) < 10:
+            print(f"✗ Only {len(samples)} lesson plans stored; need at least 10 to train a dictionary")
+            return
+
+        dictionary = build_dictionary(samples, codec, size)
+        raw, plain, with_dictionary = evaluate(samples, codec, dictionary)
+        print(f"Trained {codec_name} dictionary of {len(dictionary)} bytes on {len(samples)} plans")
+        print(f"  raw JSON: {raw / 1024:.0f} KB")
+        print(f"  {codec_name}: {plain / 1024:.0f} KB ({raw / max(plain, 1):.1f}x)")
+        print(f"  {codec_name} + dictionary: {with_dictionary / 1024:.0f} KB ({raw / max(with_dictionary, 1):.1f}x)")
+
+        if dry_run:
+            print("Dry run only; dictionary not saved")
+            return
+        row = ContentDictionary(codec=codec_name, data=dictionary, sample_count=len(samples))
+        db.add(row)
+        db.commit()
+        content_codec.forget_latest_dictionary()
+        print(f"✓ Saved dictionary {row.id}; new writes use it within CONTENT_DICT_REFRESH_SECONDS")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a lesson plan compression dictionary")
+    parser.add_argument("--codec", choices=sorted(content_codec.CODEC_NAMES), default="zlib", help="Codec the dictionary is for (default zlib)")
+    parser.add_argument("--samples", type=int, default=1000, help="Most recent plans to train on (default 1000)")
+    parser.add_argument("--size", type=int, default=32 * 1024, help="Dictionary size in bytes (default 32768; zlib uses at most 32768)")
+    parser.add_argument("--dry-run", action="store_true", help="Report the compression ratio without saving")
+    args = parser.parse_args()
+
+    run_training(codec_name=args.codec, sample_count=args.samples, size=args.size, dry_run=args.dry_run)
@@ -0,0 +1,150 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+CACHE_ROOT = os.getenv("CACHE_ROOT", os.path.join(os.path.dirname(__file__), '..', 'cache'))
+
+
+class DiskCache:
+    """
+    Size-bounded file cache. Entries are plain files named by a hashed key so
+    they can be served directly (e.g. with FileResponse). Access time is tracked
+    through the file mtime and the least recently used entries are evicted once
+    the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, name: str, max_bytes: int, suffix: str = ""):
+        self.directory = os.path.abspath(os.path.join(CACHE_ROOT, name))
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str, group: Optional[str] = None) -> str:
+        name = self.hash_key(key) + self.suffix
+        if group:
+            name = f"{group}--{name}"
+        return os.path.join(self.directory, name)
+
+    def get_path(self, key: str, group: Optional[str] = None) -> Optional[str]:
+        """Return the cached file path for key (marking it recently used), or None."""
+        return self._touch(self.path_for(key, group))
+
+    def get_path_by_id(self, entry_id: str) -> Optional[str]:
+        """Look up an ungrouped entry by its hashed key, as handed out in URLs."""
+        if not re.fullmatch(r"[0-9a-f]{64}", entry_id or ""):
+            return None
+        return self._touch(os.path.join(self.directory, entry_id + self.suffix))
+
+    def _touch(self, path: str) -> Optional[str]:
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key: str, group: Optional[str] = None) -> Optional[bytes]:
+        path = self.get_path(key, group)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes, group: Optional[str] = None) -> str:
+        """Atomically write data for key and return its path."""
+        writer = self.open_writer(key, group)
+        try:
+            writer.write(data)
+        except Exception:
+            writer.discard()
+            raise
+        return writer.commit()
+
+    def open_writer(self, key: str, group: Optional[str] = None) -> "CacheWriter":
+        """Open an incremental writer; the entry only becomes visible on commit()."""
+        return CacheWriter(self, key, group)
+
+    def delete(self, key: str, group: Optional[str] = None) -> None:
+        try:
+            os.remove(self.path_for(key, group))
+        except FileNotFoundError:
+            pass
+
+    def delete_group(self, group: str) -> None:
+        """Remove every entry stored under group (e.g. all renders of one quiz)."""
+        prefix = f"{group}--"
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_file() or entry.name.startswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            # Oldest first
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+
+class CacheWriter:
+    """Streams bytes into a temp file and moves it into the cache on commit()."""
+
+    def __init__(self, cache: DiskCache, key: str, group: Optional[str] = None):
+        self.cache = cache
+        self.key = key
+        self.group = group
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".tmp", dir=cache.directory)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+
+    def commit(self) -> str:
+        self._file.close()
+        path = self.cache.path_for(self.key, self.group)
+        os.replace(self.tmp_path, path)
+        self.cache._evict()
+        return path
+
+    def discard(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
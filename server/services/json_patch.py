@@ -0,0 +1,143 @@
+"""
+Copy-on-write patch engine for lesson plan JSON.
+
+Refinement patches from Gemini address parts of a plan with paths such as
+"subtopicSections[2].timeline[3]", "sessions[0].homework" or
+"discussionQuestions[1]" and carry the new content for that node. Paths are
+compiled once into tuples of keys and indexes. Applying a batch copies only
+the containers along the touched paths; every other part of the result is
+shared with the original plan, which is never modified.
+
+A patched dict is merged key by key into the existing node and marked
+"isUpdated": True when anything actually changed (the UI highlights these).
+The special path "header" updates the plan's title and learning objectives.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+Step = Union[str, int]
+
+HEADER_PATH = "header"
+HEADER_FIELDS = ("title", "learningObjectives")
+UPDATED_FLAG = "isUpdated"
+
+_SEGMENT = re.compile(r"([^.\[\]]+)|\[(\d+)\]|(\.)")
+
+
+@lru_cache(maxsize=1024)
+def compile_path(path: str) -> Tuple[Step, ...]:
+    """"subtopicSections[2].timeline[3]" -> ("subtopicSections", 2, "timeline", 3)."""
+    steps: List[Step] = []
+    position = 0
+    for match in _SEGMENT.finditer(path):
+        if match.start() != position:
+            raise ValueError(f"Invalid patch path: {path}")
+        position = match.end()
+        key, index, _ = match.groups()
+        if key is not None:
+            steps.append(key.strip())
+        elif index is not None:
+            steps.append(int(index))
+    if position != len(path) or not steps:
+        raise ValueError(f"Invalid patch path: {path}")
+    return tuple(steps)
+
+
+def merge(target: Any, source: Any) -> Tuple[Any, bool]:
+    """Merge source into target (dicts key by key, anything else replaced). Returns (merged, changed)."""
+    if isinstance(target, dict) and isinstance(source, dict):
+        changed = False
+        merged = None
+        for key, value in source.items():
+            if key == UPDATED_FLAG:
+                continue
+            if key not in target or target[key] != value:
+                if merged is None:
+                    merged = dict(target)
+                merged[key] = value
+                changed = True
+        return (merged if changed else target), changed
+    return source, target != source
+
+
+class _Writer:
+    """Tracks which containers of the result are private copies for this batch."""
+
+    def __init__(self, document: Dict[str, Any]):
+        self.root = dict(document)
+        self._copied = {id(self.root)}
+
+    def _writable(self, parent, step):
+        child = parent[step]
+        if id(child) not in self._copied:
+            child = dict(child) if isinstance(child, dict) else list(child)
+            self._copied.add(id(child))
+            parent[step] = child
+        return child
+
+    def resolve(self, steps: Tuple[Step, ...]):
+        """Writable parent container of the node at steps; raises LookupError/TypeError if missing."""
+        parent = self.root
+        for step in steps[:-1]:
+            node = parent[step]
+            if not isinstance(node, (dict, list)):
+                raise TypeError(f"Cannot descend into {type(node).__name__} at {step!r}")
+            parent = self._writable(parent, step)
+        # Missing final keys/indexes are not created; patches only edit existing nodes
+        parent[steps[-1]]
+        return parent
+
+    def store(self, parent, step, value):
+        parent[step] = value
+        if isinstance(value, (dict, list)):
+            # Already a fresh object from merge() or the patch itself
+            self._copied.add(id(value))
+
+
+def _apply_header(writer: _Writer, content: Any) -> bool:
+    if not isinstance(content, dict):
+        return False
+    changed = False
+    for field in HEADER_FIELDS:
+        if field in content and content[field] != writer.root.get(field):
+            writer.root[field] = content[field]
+            changed = True
+    return changed
+
+
+def apply_patches(document: Dict[str, Any], patches: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Apply patches ({"path": ..., "content": ...}) in order.
+    Returns (new document, paths that changed). Patches whose path does not
+    exist in the document are skipped.
+    """
+    writer = _Writer(document)
+    changed_paths = []
+    for patch in patches:
+        path = patch.get("path")
+        content = patch.get("content")
+        if not path or content is None:
+            continue
+
+        if path == HEADER_PATH:
+            if _apply_header(writer, content):
+                changed_paths.append(path)
+            continue
+
+        try:
+            steps = compile_path(path)
+            parent = writer.resolve(steps)
+        except (ValueError, LookupError, TypeError) as e:
+            print(f"DEBUG: Skipping patch to {path}: {str(e)}")
+            continue
+
+        merged, changed = merge(parent[steps[-1]], content)
+        if changed:
+            if isinstance(merged, dict):
+                if merged is content:
+                    merged = dict(content)
+                merged[UPDATED_FLAG] = True
+            writer.store(parent, steps[-1], merged)
+            changed_paths.append(path)
+    return writer.root, changed_paths
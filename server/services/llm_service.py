@@ -1,9 +1,13 @@
 import json
 import re
 import requests
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from services import json_patch
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -199,7 +203,7 @@ def summarize_text(text: str, max_length: int = 8000) -> str:
     summary = '\n\n'.join(summary_parts)
     return summary[:max_length] + "..." if len(summary) > max_length else summary
 
-def generate_lesson_plan(text: str, grade: int, subject: str, class_duration_mins: int, refinement_prompt: str = None, context: str = None) -> Dict[str, Any]:
+def generate_lesson_plan(text: str, grade: int, subject: str, class_duration_mins: int, refinement_prompt: str = None, context: str = None, source_has_timestamps: bool = False, text_is_budgeted: bool = False) -> Dict[str, Any]:
     """
     Generate or refine a lesson plan using Google's Gemini API.
 
@@ -210,6 +214,9 @@ def generate_lesson_plan(text: str, grade: int, subject: str, class_duration_min
         class_duration_mins: Duration of a single class session in minutes
         refinement_prompt: Optional instructions to tweak an existing plan
         context: Optional retrieved context from vector DB
+        source_has_timestamps: Source text is timed video excerpts ("[mm:ss–mm:ss] ...")
+        text_is_budgeted: Source text was already cut to the prompt budget (ranked
+                          transcript excerpts); skip summarize_text, which would drop them
 
     Returns:
         Dict containing lesson plan JSON
@@ -244,7 +251,14 @@ If the plan uses 'sessions', maintain the session structure and timing.
     else:
         # Summarize long text to prevent API limits - leave more room for response
         original_length = len(text)
-        text = summarize_text(text, max_length=4000)
+        if not text_is_budgeted:
+            text = summarize_text(text, max_length=4000)
+
+        timestamp_guideline = ""
+        if source_has_timestamps:
+            timestamp_guideline = """
+6. VIDEO TIMESTAMPS: The source text is made of video excerpts, each starting with its [mm:ss–mm:ss] position. When a timeline activity draws on an excerpt, add a "videoTimestamp" field (e.g. "04:30") to that timeline item so the teacher can play that part of the video.
+"""
         
         user_message = f"""
 SOURCE TEXT:
@@ -268,7 +282,7 @@ IMPORTANT GUIDELINES:
    - Each activity should have a duration in minutes
 4. ENGAGEMENT: Use REAL-LIFE examples, HANDS-ON activities, and student participation. Make the teacher script CONVERSATIONAL and ENTHUSIASTIC.
 5. SERIAL NUMBERS: Each activity in the timeline MUST have a sequential `itemNumber` starting from 1 for each subtopic.
-
+{timestamp_guideline}
 
 REQUIRED JSON FORMAT:
 {{
@@ -430,115 +444,14 @@ REQUIRED OUTPUT FORMAT:
 def apply_patches(original_plan: Dict[str, Any], patches_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Apply a list of patches to a lesson plan JSON.
+    The original plan is not modified; see services/json_patch.py.
     """
-    import re
-    # Deep copy
-    new_plan = json.loads(json.dumps(original_plan))
-    
-    def merge_content(target, source, path=""):
-        """Helper to merge dicts or replace other types. Returns (merged, changed)"""
-        changed = False
-        if isinstance(target, dict) and isinstance(source, dict):
-            merged = target.copy()
-            for k, v in source.items():
-                if k == "isUpdated": continue
-                if k in target and target[k] != v:
-                    print(f"DEBUG: Field '{k}' changed at {path}")
-                    changed = True
-                elif k not in target:
-                    print(f"DEBUG: New field '{k}' added at {path}")
-                    changed = True
-                merged[k] = v
-            return merged, changed
-        
-        # For non-dicts, check for change
-        changed = (target != source)
-        return source, changed
-
     patches = patches_data.get("patches", [])
-    print(f"DEBUG: Found {len(patches)} patches to apply.")
-    for patch in patches:
-        path = patch.get("path")
-        content = patch.get("content")
-        print(f"DEBUG: Applying patch to path: {path}")
-        
-        if not path or content is None:
-            continue
-            
-        try:
-            if path == "header":
-                if isinstance(content, dict):
-                    if "title" in content and content["title"] != new_plan.get("title"):
-                        new_plan["title"] = content["title"]
-                        # Header doesn't currently support isUpdated in UI but good for consistency
-                    if "learningObjectives" in content and content["learningObjectives"] != new_plan.get("learningObjectives"):
-                        new_plan["learningObjectives"] = content["learningObjectives"]
-                continue
-                
-            # Parse sessions[i]... or subtopicSections[i]...
-            session_match = re.match(r"sessions\[(\d+)\]", path)
-            subtopic_match = re.match(r"subtopicSections\[(\d+)\]", path)
-            
-            if session_match:
-                s_idx = int(session_match.group(1))
-                if s_idx >= len(new_plan.get("sessions", [])): continue
-                
-                remaining = path[len(session_match.group(0)):].strip(".")
-                
-                if not remaining:
-                    merged, changed = merge_content(new_plan["sessions"][s_idx], content, path)
-                    if changed: merged["isUpdated"] = True
-                    new_plan["sessions"][s_idx] = merged
-                elif remaining.startswith("timeline"):
-                    timeline_match = re.match(r"timeline\[(\d+)\]", remaining)
-                    if timeline_match:
-                        t_idx = int(timeline_match.group(1))
-                        if t_idx < len(new_plan["sessions"][s_idx].get("timeline", [])):
-                            merged, changed = merge_content(new_plan["sessions"][s_idx]["timeline"][t_idx], content, path)
-                            if changed: merged["isUpdated"] = True
-                            new_plan["sessions"][s_idx]["timeline"][t_idx] = merged
-                elif remaining == "homework":
-                    merged, changed = merge_content(new_plan["sessions"][s_idx]["homework"], content, path)
-                    if changed: merged["isUpdated"] = True
-                    new_plan["sessions"][s_idx]["homework"] = merged
-            
-            elif subtopic_match:
-                s_idx = int(subtopic_match.group(1))
-                if s_idx >= len(new_plan.get("subtopicSections", [])): continue
-                
-                remaining = path[len(subtopic_match.group(0)):].strip(".")
-                
-                if not remaining:
-                    merged, changed = merge_content(new_plan["subtopicSections"][s_idx], content, path)
-                    if changed: merged["isUpdated"] = True
-                    new_plan["subtopicSections"][s_idx] = merged
-                elif remaining.startswith("timeline"):
-                    timeline_match = re.match(r"timeline\[(\d+)\]", remaining)
-                    if timeline_match:
-                        t_idx = int(timeline_match.group(1))
-                        if t_idx < len(new_plan["subtopicSections"][s_idx].get("timeline", [])):
-                            merged, changed = merge_content(new_plan["subtopicSections"][s_idx]["timeline"][t_idx], content, path)
-                            if changed: merged["isUpdated"] = True
-                            new_plan["subtopicSections"][s_idx]["timeline"][t_idx] = merged
-                elif remaining == "homework":
-                    merged, changed = merge_content(new_plan["subtopicSections"][s_idx]["homework"], content, path)
-                    if changed: merged["isUpdated"] = True
-                    new_plan["subtopicSections"][s_idx]["homework"] = merged
-                    
-            elif path.startswith("discussionQuestions"):
-                dq_match = re.match(r"discussionQuestions\[(\d+)\]", path)
-                if dq_match:
-                    q_idx = int(dq_match.group(1))
-                    if q_idx < len(new_plan.get("discussionQuestions", [])):
-                        merged, changed = merge_content(new_plan["discussionQuestions"][q_idx], content, path)
-                        if changed: merged["isUpdated"] = True
-                        new_plan["discussionQuestions"][q_idx] = merged
-        except Exception as e:
-            print(f"Error applying patch to {path}: {str(e)}")
-            
+    new_plan, changed_paths = json_patch.apply_patches(original_plan, patches)
+    print(f"DEBUG: Applied {len(patches)} patches, {len(changed_paths)} changed: {changed_paths}")
     return new_plan
 
-def generate_chapter_index(subject: str, grade: int, board: str) -> Dict[str, Any]:
+def generate_chapter_index(subject: str, grade: int, board: str, usage: Optional[Dict[str, int]] = None, limiter=None) -> Dict[str, Any]:
     """
     Generate a comprehensive chapter index for a subject/grade/board combination.
     
@@ -546,6 +459,10 @@ def generate_chapter_index(subject: str, grade: int, board: str) -> Dict[str, An
         subject: Subject name (e.g., "Mathematics", "Science")
         grade: Grade level (1-12)
         board: Education board (e.g., "CBSE", "ICSE", "State Board")
+        usage: Optional dict that receives Gemini's token counts
+               (promptTokenCount, candidatesTokenCount, totalTokenCount)
+        limiter: Optional context manager entered around the Gemini request
+                 (e.g. a rate limit and concurrency slot shared by callers)
     
     Returns:
         Dict containing:
@@ -616,16 +533,41 @@ REQUIRED JSON FORMAT:
 }}
 """
     
+    generated_text, _ = _call_gemini(f"{system_prompt}\n\n{user_message}", temperature=0.3, usage=usage, label="Chapter Index Generation", limiter=limiter)
+    return parse_ai_json(generated_text)
+
+
+# Generate chapter indexes as chapter list + parallel subtopic chunks by default
+CHAPTER_INDEX_CHUNKED = os.getenv("CHAPTER_INDEX_CHUNKED", "false").lower() == "true"
+CHAPTER_INDEX_CHUNK_SIZE = int(os.getenv("CHAPTER_INDEX_CHUNK_SIZE", "4"))
+CHAPTER_INDEX_MAX_CONCURRENCY = int(os.getenv("CHAPTER_INDEX_MAX_CONCURRENCY", "4"))
+
+_usage_lock = threading.Lock()
+
+def _add_usage(usage: Optional[Dict[str, int]], usage_metadata: Dict[str, Any]):
+    if usage is None:
+        return
+    with _usage_lock:
+        for name, value in usage_metadata.items():
+            if isinstance(value, int):
+                usage[name] = usage.get(name, 0) + value
+
+def _call_gemini(prompt: str, temperature: float, usage: Optional[Dict[str, int]] = None, label: str = "Gemini", limiter=None) -> Tuple[str, Optional[str]]:
+    """
+    Send one prompt to Gemini and return (generated text, finish reason).
+    Token counts are added to usage when given. The request is made inside
+    limiter (a context manager, e.g. a rate limit and concurrency slot) when given.
+    """
     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-flash-latest:generateContent?key={GEMINI_API_KEY}"
     
     payload = {
         "contents": [{
             "parts": [{
-                "text": f"{system_prompt}\n\n{user_message}"
+                "text": prompt
             }]
         }],
         "generationConfig": {
-            "temperature": 0.3,  # Lower temperature for more consistent curriculum
+            "temperature": temperature,
             "topK": 40,
             "topP": 0.95,
             "maxOutputTokens": 8192,
@@ -633,24 +575,23 @@ REQUIRED JSON FORMAT:
     }
     
     try:
-        response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
+        with limiter or nullcontext():
+            response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
         response.raise_for_status()
         
         result = response.json()
+        _add_usage(usage, result.get("usageMetadata", {}))
         
         if "candidates" in result and len(result["candidates"]) > 0:
             candidate = result["candidates"][0]
             finish_reason = candidate.get("finishReason")
-            print(f"DEBUG: Chapter Index Generation - Finish Reason: {finish_reason}")
+            print(f"DEBUG: {label} - Finish Reason: {finish_reason}")
             
             if finish_reason == "SAFETY":
-                raise ValueError("Chapter index could not be generated due to safety filters.")
+                raise ValueError(f"{label} was blocked by safety filters.")
             
             if "content" in candidate and "parts" in candidate["content"]:
-                generated_text = candidate["content"]["parts"][0]["text"]
-                
-                # Use shared parsing utility
-                return parse_ai_json(generated_text)
+                return candidate["content"]["parts"][0]["text"], finish_reason
             else:
                 raise ValueError("No content in API response")
         else:
@@ -660,3 +601,120 @@ REQUIRED JSON FORMAT:
         raise ValueError(f"Gemini API request failed: {str(e)}")
     except KeyError as e:
         raise ValueError(f"Unexpected API response structure: {str(e)}")
+
+def generate_chapter_list(subject: str, grade: int, board: str, usage: Optional[Dict[str, int]] = None, limiter=None) -> List[Dict[str, Any]]:
+    """
+    Generate only the chapter list (number, name, description) of a curriculum,
+    without subtopics, so the response stays small for any syllabus.
+    """
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not configured")
+    
+    system_prompt = "You are an expert curriculum designer. Return ONLY valid JSON without any markdown formatting or additional text."
+    
+    user_message = f"""
+List ALL chapters of the following curriculum:
+
+SUBJECT: {subject}
+GRADE: {grade}
+EDUCATION BOARD: {board}
+
+For each chapter, include:
+1. Chapter number (sequential, starting from 1)
+2. Chapter name (clear and descriptive, following the official {board} curriculum)
+3. One-sentence description of what the chapter covers
+
+Do NOT include subtopics.
+
+REQUIRED JSON FORMAT:
+{{
+  "chapters": [
+    {{
+      "chapterNumber": 1,
+      "chapterName": "string",
+      "description": "string"
+    }}
+  ]
+}}
+"""
+    
+    generated_text, _ = _call_gemini(f"{system_prompt}\n\n{user_message}", temperature=0.3, usage=usage, label="Chapter List Generation", limiter=limiter)
+    return parse_ai_json(generated_text).get("chapters", [])
+
+def generate_chapter_subtopics(subject: str, grade: int, board: str, chapters: List[Dict[str, Any]], usage: Optional[Dict[str, int]] = None, limiter=None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Generate subtopics for a group of chapters. Returns chapterNumber -> subtopics.
+    If the response is cut off at the output limit, the group is split in half
+    and each half is requested again.
+    """
+    chapter_lines = "\n".join(f"{c['chapterNumber']}. {c['chapterName']}" for c in chapters)
+    
+    user_message = f"""
+You are an expert curriculum designer. Return ONLY valid JSON without any markdown formatting or additional text.
+
+List the subtopics of these chapters of the {board} Grade {grade} {subject} curriculum:
+{chapter_lines}
+
+For each subtopic, include:
+1. Subtopic number (sequential within the chapter, starting from 1)
+2. Subtopic name (specific and clear)
+3. Brief description of what the subtopic covers
+
+Subtopics should be granular enough that a teacher can select specific ones to teach (typically 3-8 per chapter).
+
+REQUIRED JSON FORMAT:
+{{
+  "chapters": [
+    {{
+      "chapterNumber": 1,
+      "subtopics": [
+        {{
+          "subtopicNumber": 1,
+          "subtopicName": "string",
+          "description": "string"
+        }}
+      ]
+    }}
+  ]
+}}
+"""
+    
+    generated_text, finish_reason = _call_gemini(user_message, temperature=0.3, usage=usage, label=f"Subtopic Generation (chapters {chapters[0]['chapterNumber']}-{chapters[-1]['chapterNumber']})", limiter=limiter)
+    
+    if finish_reason == "MAX_TOKENS" and len(chapters) > 1:
+        middle = len(chapters) // 2
+        subtopics = generate_chapter_subtopics(subject, grade, board, chapters[:middle], usage, limiter)
+        subtopics.update(generate_chapter_subtopics(subject, grade, board, chapters[middle:], usage, limiter))
+        return subtopics
+    
+    return {
+        c.get("chapterNumber"): c.get("subtopics", [])
+        for c in parse_ai_json(generated_text).get("chapters", [])
+    }
+
+def generate_chapter_index_chunked(subject: str, grade: int, board: str, usage: Optional[Dict[str, int]] = None, chunk_size: int = CHAPTER_INDEX_CHUNK_SIZE, max_workers: int = CHAPTER_INDEX_MAX_CONCURRENCY, limiter=None) -> Dict[str, Any]:
+    """
+    Generate a chapter index in pieces: the chapter list first, then the
+    subtopics of each group of chunk_size chapters in parallel calls (at most
+    max_workers at a time). Same return format as generate_chapter_index, but
+    large syllabi are no longer truncated at the output limit.
+    Every one of these Gemini requests, including retries of split groups,
+    is made inside limiter when given.
+    """
+    chapters = sorted(generate_chapter_list(subject, grade, board, usage, limiter), key=lambda c: c.get("chapterNumber", 0))
+    if not chapters:
+        raise ValueError("No chapters in generated chapter list")
+    
+    groups = [chapters[i:i + chunk_size] for i in range(0, len(chapters), max(1, chunk_size))]
+    subtopics_by_chapter: Dict[int, List[Dict[str, Any]]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for subtopics in executor.map(lambda group: generate_chapter_subtopics(subject, grade, board, group, usage, limiter), groups):
+            subtopics_by_chapter.update(subtopics)
+    
+    print(f"DEBUG: Chunked chapter index: {len(chapters)} chapters in {len(groups)} groups")
+    return {
+        "chapters": [
+            {**chapter, "subtopics": subtopics_by_chapter.get(chapter["chapterNumber"], [])}
+            for chapter in chapters
+        ]
+    }
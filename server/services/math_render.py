@@ -0,0 +1,129 @@
+import io
+import os
+import re
+import struct
+import threading
+from typing import Dict, Optional, Tuple
+from services.disk_cache import DiskCache
+
+try:
+    from matplotlib import mathtext
+    from matplotlib.font_manager import FontProperties
+except ImportError:  # Math is left as raw LaTeX when matplotlib is not installed
+    mathtext = None
+
+MATH_RENDER_DPI = int(os.getenv("MATH_RENDER_DPI", "200"))
+MATH_CACHE_MAX_MB = int(os.getenv("MATH_CACHE_MAX_MB", "128"))
+
+# $$...$$, \[...\], $...$, \(...\); inline $ must hug its content so "$5 and $10" stays text
+DELIMITED_MATH_PATTERN = re.compile(r'\$\$(.+?)\$\$|\\\[(.+?)\\\]|\$(?!\s)(.+?)(?<!\s)\$|\\\((.+?)\\\)', re.DOTALL)
+
+# Bare LaTeX that Gemini often emits without delimiters, e.g. "\frac{3}{4}" or "\sqrt{16}"
+_BRACES = r'\{(?:[^{}]|\{[^{}]*\})*\}'
+BARE_MATH_PATTERN = re.compile(
+    r'\\(?:frac|dfrac|tfrac|sqrt)(?:\[[^\]]*\])?(?:' + _BRACES + r')+'
+    r'|\\(?:times|div|pm|cdot|leq|geq|neq|approx|pi|theta|alpha|beta|degree)\b'
+)
+
+_cache = DiskCache("math", max_bytes=MATH_CACHE_MAX_MB * 1024 * 1024, suffix=".png")
+# Baseline depth of each image, stored next to it
+_depth_cache = DiskCache("math", max_bytes=MATH_CACHE_MAX_MB * 1024 * 1024, suffix=".depth")
+
+# (formula, size) -> (png path, width pt, height pt, depth pt); None when the formula failed to render
+_MAX_RENDERED_ENTRIES = 10000
+_rendered: Dict[Tuple[str, float], Optional[Tuple[str, float, float, float]]] = {}
+_lock = threading.Lock()
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _png_size(data: bytes) -> Tuple[int, int]:
+    return struct.unpack(">II", data[16:24])
+
+
+def render_formula(formula: str, font_size: float = 11) -> Optional[Tuple[str, float, float, float]]:
+    """
+    Render a LaTeX formula to a PNG and return (path, width, height, depth) in
+    points. Images are cached on disk by a hash of the formula, so every question,
+    quiz and variant using the same formula shares one render.
+    """
+    if mathtext is None:
+        return None
+
+    key = (formula, font_size)
+    cache_key = f"{formula}|{font_size}|{MATH_RENDER_DPI}"
+    with _lock:
+        known = key in _rendered
+        result = _rendered.get(key)
+    # Touch the file so it stays recently used; re-render if it was evicted
+    if known and (result is None or _cache.get_path(cache_key)):
+        return result
+
+    path = _cache.get_path(cache_key)
+    depth = _depth_cache.get(cache_key)
+    if path and depth is not None:
+        with open(path, "rb") as f:
+            width_px, height_px = _png_size(f.read(24))
+        depth_px = float(depth.decode("ascii"))
+    else:
+        buffer = io.BytesIO()
+        try:
+            depth_px = mathtext.math_to_image(f"${formula}$", buffer, prop=FontProperties(size=font_size),
+                                              dpi=MATH_RENDER_DPI, format="png")
+        except Exception as e:
+            print(f"Math render failed for {formula!r}: {str(e)}")
+            with _lock:
+                _rendered[key] = None
+            return None
+        data = buffer.getvalue()
+        width_px, height_px = _png_size(data)
+        path = _cache.put(cache_key, data)
+        _depth_cache.put(cache_key, str(depth_px).encode("ascii"))
+
+    scale = 72.0 / MATH_RENDER_DPI
+    result = (path, width_px * scale, height_px * scale, depth_px * scale)
+    with _lock:
+        if len(_rendered) >= _MAX_RENDERED_ENTRIES:
+            _rendered.clear()
+        _rendered[key] = result
+    return result
+
+
+def _image_markup(formula: str, font_size: float) -> str:
+    rendered = render_formula(formula.strip(), font_size)
+    if not rendered:
+        return _escape(formula)
+    path, width, height, depth = rendered
+    return f'<img src="{path}" width="{width:.2f}" height="{height:.2f}" valign="{-depth:.2f}"/>'
+
+
+def contains_math(text: str) -> bool:
+    return bool(DELIMITED_MATH_PATTERN.search(text) or BARE_MATH_PATTERN.search(text))
+
+
+def math_to_markup(text: str, font_size: float = 11) -> str:
+    """
+    Replace LaTeX spans in text with inline images for a ReportLab Paragraph.
+    Text without math is returned unchanged.
+    """
+    if not text or ("\\" not in text and "$" not in text):
+        return text
+
+    def replace_delimited(match):
+        formula = next(group for group in match.groups() if group is not None)
+        return _image_markup(formula, font_size)
+
+    def replace_bare(match):
+        return _image_markup(match.group(0), font_size)
+
+    # Bare commands are only looked for outside delimited spans
+    parts = []
+    last = 0
+    for match in DELIMITED_MATH_PATTERN.finditer(text):
+        parts.append(BARE_MATH_PATTERN.sub(replace_bare, text[last:match.start()]))
+        parts.append(replace_delimited(match))
+        last = match.end()
+    parts.append(BARE_MATH_PATTERN.sub(replace_bare, text[last:]))
+    return "".join(parts)
@@ -0,0 +1,42 @@
+import threading
+from typing import Dict, Any
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    """Add value to a monotonically increasing counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """Record the current value of something that goes up and down (e.g. queue length)."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record a duration sample; count/total/max are kept per name."""
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        timing["count"] += 1
+        timing["total_seconds"] += seconds
+        timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return a copy of all metrics for the /metrics endpoint."""
+    with _lock:
+        timings = {}
+        for name, timing in _timings.items():
+            avg = timing["total_seconds"] / timing["count"] if timing["count"] else 0.0
+            timings[name] = {**timing, "avg_seconds": avg}
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings
+        }
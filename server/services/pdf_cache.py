@@ -0,0 +1,39 @@
+import os
+import hashlib
+from datetime import datetime
+from typing import Optional
+from services.disk_cache import DiskCache
+from services.pdf_service import RENDERER_VERSION
+
+PDF_CACHE_MAX_MB = int(os.getenv("PDF_CACHE_MAX_MB", "512"))
+
+_cache = DiskCache("quiz_pdfs", max_bytes=PDF_CACHE_MAX_MB * 1024 * 1024, suffix=".pdf")
+
+
+def _group(quiz_id: int) -> str:
+    return f"quiz-{quiz_id}"
+
+
+def cache_key(quiz_id: int, updated_at: Optional[datetime]) -> str:
+    """Cache key for a rendered quiz: (quiz id, last update, renderer version)."""
+    stamp = updated_at.isoformat() if updated_at else "never"
+    return f"{quiz_id}:{stamp}:{RENDERER_VERSION}"
+
+
+def etag_for(quiz_id: int, updated_at: Optional[datetime]) -> str:
+    digest = hashlib.sha1(cache_key(quiz_id, updated_at).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+
+def get_cached_pdf_path(quiz_id: int, updated_at: Optional[datetime]) -> Optional[str]:
+    return _cache.get_path(cache_key(quiz_id, updated_at), group=_group(quiz_id))
+
+
+def store_pdf(quiz_id: int, updated_at: Optional[datetime], pdf_bytes: bytes) -> str:
+    """Store a rendered quiz, replacing renders of any older revision."""
+    _cache.delete_group(_group(quiz_id))
+    return _cache.put(cache_key(quiz_id, updated_at), pdf_bytes, group=_group(quiz_id))
+
+
+def invalidate_quiz(quiz_id: int) -> None:
+    _cache.delete_group(_group(quiz_id))
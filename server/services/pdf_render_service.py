@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional
+from services.pdf_service import QuizPDFGenerator
+from services import metrics
+
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_RENDER_MAX_PENDING = int(os.getenv("PDF_RENDER_MAX_PENDING", str(max(1, PDF_RENDER_WORKERS) * 4)))
+
+# Tiny quiz rendered once per worker so ReportLab loads fonts and metrics up front
+_WARMUP_QUIZ = {
+    "quiz_title": "Warm-up",
+    "instructions": "-",
+    "questions": [{"id": 1, "question_text": "-", "question_type": "mcq", "options": [{"label": "A", "text": "-"}], "correct_answer": "A"}]
+}
+
+# Per-worker generator with pre-built style sheets
+_worker_generator: Optional[QuizPDFGenerator] = None
+
+
+def _init_worker():
+    global _worker_generator
+    _worker_generator = QuizPDFGenerator()
+    _worker_generator.generate_pdf(_WARMUP_QUIZ)
+
+
+def _render_in_worker(method: str, payload: Any):
+    """Runs inside the pool. Returns (pdf bytes, seconds spent rendering)."""
+    start = time.perf_counter()
+    pdf_bytes = getattr(_worker_generator, method)(payload)
+    return pdf_bytes, time.perf_counter() - start
+
+
+class PDFRenderService:
+    """
+    Renders quiz PDFs off the request thread in a bounded process pool, so
+    ReportLab layout no longer holds the API worker's GIL. At most max_pending
+    renders are submitted at once; further callers wait for a slot.
+    Set PDF_RENDER_WORKERS=0 to render in a single background thread instead.
+    """
+
+    def __init__(self, workers: int = PDF_RENDER_WORKERS, max_pending: int = PDF_RENDER_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._in_flight = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, initializer=_init_worker)
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        return self._semaphore
+
+    def _report_queue(self):
+        # Renders waiting for a slot plus those submitted but not yet picked up by a worker
+        queued = self._waiting + max(0, self._in_flight - max(1, self.workers))
+        metrics.set_gauge("pdf_render_queue_length", queued)
+        metrics.set_gauge("pdf_render_in_flight", self._in_flight)
+
+    async def render(self, quiz_data: Dict[str, Any]) -> bytes:
+        """Render a quiz PDF in the pool and return its bytes."""
+        return await self._submit("generate_pdf", quiz_data)
+
+    async def render_booklet(self, variants: List[Dict[str, Any]]) -> bytes:
+        """Render all quiz variants into one PDF with a single worker's styles."""
+        return await self._submit("generate_booklet", variants)
+
+    async def _submit(self, method: str, payload: Any) -> bytes:
+        submitted = time.perf_counter()
+        self._waiting += 1
+        self._report_queue()
+        async with self._get_semaphore():
+            self._waiting -= 1
+            self._in_flight += 1
+            self._report_queue()
+            try:
+                loop = asyncio.get_running_loop()
+                try:
+                    pdf_bytes, render_seconds = await loop.run_in_executor(self._get_executor(), _render_in_worker, method, payload)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM); start a fresh pool for the next caller
+                    self.shutdown()
+                    metrics.increment("pdf_render_pool_restarts")
+                    raise
+            finally:
+                self._in_flight -= 1
+                self._report_queue()
+
+        total_seconds = time.perf_counter() - submitted
+        metrics.increment("pdf_renders")
+        metrics.observe("pdf_render_seconds", render_seconds)
+        metrics.observe("pdf_render_wait_seconds", max(0.0, total_seconds - render_seconds))
+        return pdf_bytes
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+render_service = PDFRenderService()
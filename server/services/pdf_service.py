@@ -1,17 +1,24 @@
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
 from reportlab.lib import colors
 from io import BytesIO
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List
+from services.math_render import math_to_markup, contains_math
+
+# Bump whenever the PDF layout changes so cached renders are regenerated
+RENDERER_VERSION = "4"
 
 class QuizPDFGenerator:
     def __init__(self):
         self.width, self.height = letter
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
+        self._setup_templates()
+        self._reset_layout_caches()
 
     def _setup_custom_styles(self):
         """Define custom paragraph styles for quiz."""
@@ -29,21 +36,93 @@ class QuizPDFGenerator:
             parent=self.styles["Normal"],
             fontSize=11,
             spaceAfter=10,
-            textColor=colors.black
+            textColor=colors.black,
+            leftIndent=0.4*inch,
+            bulletIndent=0,
+            bulletFontName="Helvetica-Bold",
+            bulletFontSize=11
         ))
 
+        self.styles.add(ParagraphStyle(
+            name="OptionText",
+            parent=self.styles["Normal"],
+            fontSize=11,
+            spaceAfter=3,
+            leftIndent=0.8*inch,
+            bulletIndent=0.4*inch,
+            bulletFontSize=11
+        ))
+
+    def _setup_templates(self):
+        """Table styles and layout shared by every paper rendered with this generator."""
+        self.answer_table_header = ["Question", "Answer", "Explanation"]
+        self.answer_table_col_widths = [1*inch, 1*inch, 3.5*inch]
+        self.answer_table_style = TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1E3A5F")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, 0), 10),
+            ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+            ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
+            ("GRID", (0, 0), (-1, -1), 1, colors.grey),
+        ])
+
+    def _reset_layout_caches(self):
+        # Parsed markup and line breaks are shared within one document only
+        self._frag_cache = {}
+        self._layout_cache = {}
+
     def generate_pdf(self, quiz_data: Dict[str, Any]) -> bytes:
         """
         Generate PDF from quiz JSON data.
         Returns PDF as bytes.
         """
+        story = self._paper_story(quiz_data)
+
+        # Page break before answer key
+        story.append(PageBreak())
+        story.extend(self._answer_key_story(quiz_data, "ANSWER KEY"))
+
+        return self._build(story)
+
+    def generate_booklet(self, variants: List[Dict[str, Any]]) -> bytes:
+        """
+        Render several quiz variants into one PDF in a single layout pass:
+        every paper first, then the answer key of each variant.
+        """
+        story = []
+        for variant in variants:
+            story.extend(self._paper_story(variant))
+            story.append(PageBreak())
+
+        for idx, variant in enumerate(variants):
+            heading = f"ANSWER KEY - {variant['variant_label']}" if variant.get("variant_label") else "ANSWER KEY"
+            story.extend(self._answer_key_story(variant, heading))
+            if idx < len(variants) - 1:
+                story.append(PageBreak())
+
+        return self._build(story)
+
+    def _build(self, story: List[Any]) -> bytes:
         buffer = BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch)
 
+        # Build PDF
+        doc.build(story)
+        self._reset_layout_caches()
+        buffer.seek(0)
+        return buffer.getvalue()
+
+    def _paper_story(self, quiz_data: Dict[str, Any]) -> List[Any]:
+        """Header, instructions and questions of a quiz paper."""
         story = []
 
         # Header
-        story.append(Paragraph(quiz_data["quiz_title"], self.styles["QuizTitle"]))
+        title = quiz_data["quiz_title"]
+        if quiz_data.get("variant_label"):
+            title = f"{title} ({quiz_data['variant_label']})"
+        story.append(Paragraph(title, self.styles["QuizTitle"]))
         story.append(Paragraph(f"Grade: {quiz_data.get('grade', 'N/A')} | Subject: {quiz_data.get('subject', 'N/A')}", self.styles["Normal"]))
         story.append(Spacer(1, 0.2*inch))
 
@@ -54,71 +133,110 @@ class QuizPDFGenerator:
 
         # Questions
         for idx, q in enumerate(quiz_data["questions"], 1):
-            story.append(self._render_question(q, idx))
+            story.extend(self._render_question(q, idx))
             story.append(Spacer(1, 0.15*inch))
 
-        # Page break before answer key
-        story.append(PageBreak())
+        return story
+
+    def _answer_key_story(self, quiz_data: Dict[str, Any], heading: str) -> List[Any]:
+        story = []
 
         # Answer Key
-        story.append(Paragraph("ANSWER KEY", self.styles["Heading2"]))
+        story.append(Paragraph(heading, self.styles["Heading2"]))
         story.append(Spacer(1, 0.2*inch))
 
-        answer_table_data = [["Question", "Answer", "Explanation"]]
+        answer_table_data = [self.answer_table_header]
         for q in quiz_data["questions"]:
+            answer = q.get("correct_answer", q.get("answer", "N/A"))
+            if isinstance(answer, str) and contains_math(answer):
+                answer = self._paragraph(math_to_markup(answer, font_size=10), "Normal")
             answer_table_data.append([
                 f"Q{q['id']}",
-                q.get("correct_answer", q.get("answer", "N/A")),
+                answer,
                 q.get("explanation", "")[:100] + "..." if q.get("explanation") else ""
             ])
 
-        answer_table = Table(answer_table_data, colWidths=[1*inch, 1*inch, 3.5*inch])
-        answer_table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1E3A5F")),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("FONTSIZE", (0, 0), (-1, 0), 10),
-            ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-            ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
-            ("GRID", (0, 0), (-1, -1), 1, colors.grey),
-        ]))
+        answer_table = Table(answer_table_data, colWidths=self.answer_table_col_widths)
+        answer_table.setStyle(self.answer_table_style)
         story.append(answer_table)
+        return story
 
-        # Build PDF
-        doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
-
-    def _render_question(self, question: Dict[str, Any], q_number: int) -> Paragraph:
+    def _paragraph(self, markup: str, style_name: str, bullet: str = None) -> Paragraph:
+        """
+        Build a paragraph, reusing the parsed markup of identical text seen earlier
+        in the same document (e.g. the same question in another variant).
+        """
+        key = (markup, style_name)
+        style = self.styles[style_name]
+        frags = self._frag_cache.get(key)
+        if frags is None:
+            paragraph = _SharedLayoutParagraph(markup, style, bulletText=bullet)
+            self._frag_cache[key] = paragraph.frags
+        else:
+            paragraph = _SharedLayoutParagraph(markup, style, bulletText=bullet, frags=frags)
+        # A bullet wider than the indent narrows the first line, so it is part of the layout
+        paragraph.layout_key = key + (_bullet_overhang(bullet, style),)
+        paragraph.layout_cache = self._layout_cache
+        return paragraph
+
+    def _render_question(self, question: Dict[str, Any], q_number: int) -> List[Paragraph]:
         """Render a single question with its options."""
 
         q_type = question.get("question_type", "mcq")
 
-        # Question stem
-        html = f"""
-        <b>Q{q_number}. {question['question_text']}</b><br/>
-        """
+        # Question stem; the number is a bullet so the text lays out identically at any position
+        question_text = math_to_markup(str(question['question_text']))
+        flowables = [self._paragraph(f"<b>{question_text}</b>", "QuestionText", bullet=f"Q{q_number}.")]
 
         if q_type == "mcq":
             # MCQ options
             for opt in question.get("options", []):
-                html += f"&nbsp;&nbsp;&nbsp;&nbsp;{opt['label']}) {opt['text']}<br/>"
+                flowables.append(self._paragraph(math_to_markup(str(opt["text"])), "OptionText", bullet=f"{opt['label']})"))
 
         elif q_type == "short_answer":
-            html += "<i>[Answer space for student response]</i><br/>"
+            flowables.append(self._paragraph("<i>[Answer space for student response]</i>", "OptionText"))
 
         elif q_type == "true_false":
-            html += "&nbsp;&nbsp;&nbsp;&nbsp;A) True&nbsp;&nbsp;&nbsp;&nbsp;B) False<br/>"
+            flowables.append(self._paragraph("A) True&nbsp;&nbsp;&nbsp;&nbsp;B) False", "OptionText"))
 
         elif q_type == "fill_blank":
             # For fill in the blank, the question text should contain underscores or similar
-            html += "<i>[Fill in the blank]</i><br/>"
+            flowables.append(self._paragraph("<i>[Fill in the blank]</i>", "OptionText"))
 
         elif q_type == "essay":
-            html += "<i>[Essay response space - write your answer below]</i><br/>"
+            flowables.append(self._paragraph("<i>[Essay response space - write your answer below]</i>", "OptionText"))
             # Add some space for essay answers
-            html += "<br/><br/><br/>"
-
-        html += "<br/>"
-        return Paragraph(html, self.styles["QuestionText"])
\ No newline at end of file
+            flowables.append(Spacer(1, 0.6*inch))
+
+        return flowables
+
+
+def _bullet_overhang(bullet: str, style: ParagraphStyle) -> float:
+    """How far a bullet runs past the text indent (reportlab shortens the first line by this much)."""
+    if not bullet:
+        return 0.0
+    bullet_end = style.bulletIndent + stringWidth(bullet, style.bulletFontName, style.bulletFontSize) + 0.6 * style.bulletFontSize
+    return max(0.0, bullet_end - (style.leftIndent + style.firstLineIndent))
+
+
+class _SharedLayoutParagraph(Paragraph):
+    """
+    Paragraph that shares line-breaking results with identical paragraphs of the
+    same document. Variants repeat every question, so each distinct text is
+    wrapped once per width instead of once per copy.
+    """
+    layout_key = None
+    layout_cache = None
+
+    def wrap(self, availWidth, availHeight):
+        if self.layout_cache is None:
+            return super().wrap(availWidth, availHeight)
+        key = (self.layout_key, availWidth)
+        cached = self.layout_cache.get(key)
+        if cached is None:
+            result = super().wrap(availWidth, availHeight)
+            self.layout_cache[key] = (self.blPara, self._wrapWidths, self.height)
+            return result
+        self.width = availWidth
+        self.blPara, self._wrapWidths, self.height = cached
+        return self.width, self.height
@@ -0,0 +1,88 @@
+import copy
+import random
+import re
+from typing import Dict, Any, List, Optional
+
+# Leading option label in an answer such as "B", "B)", "(b) 42" or "B. Photosynthesis"
+ANSWER_LABEL_PATTERN = re.compile(r'^\s*\(?([A-Za-z])\)?(?=$|[\s).:\-])')
+
+
+def variant_label(index: int) -> str:
+    """0 -> "Variant A", 25 -> "Variant Z", 26 -> "Variant AA", ..."""
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return f"Variant {letters}"
+
+
+def _remap_answer(answer: Any, label_map: Dict[str, str]) -> Any:
+    """Rewrite the option label at the start of an MCQ answer using label_map."""
+    if not isinstance(answer, str):
+        return answer
+    match = ANSWER_LABEL_PATTERN.match(answer)
+    if not match:
+        return answer
+    old_label = match.group(1).upper()
+    if old_label not in label_map:
+        return answer
+    return answer[:match.start(1)] + label_map[old_label] + answer[match.end(1):]
+
+
+def _shuffle_options(question: Dict[str, Any], rng: random.Random) -> None:
+    options = question.get("options") or []
+    if len(options) < 2:
+        return
+
+    labels = [str(opt.get("label", "")).upper() for opt in options]
+    shuffled = options[:]
+    rng.shuffle(shuffled)
+
+    # Options keep their text but take the label of their new position
+    label_map = {}
+    new_options = []
+    for position, opt in enumerate(shuffled):
+        new_label = labels[position] or chr(ord("A") + position)
+        label_map[str(opt.get("label", "")).upper()] = new_label
+        new_options.append({**opt, "label": new_label})
+
+    question["options"] = new_options
+    for field in ("correct_answer", "answer"):
+        if field in question:
+            question[field] = _remap_answer(question[field], label_map)
+
+
+def build_variant(quiz_data: Dict[str, Any], index: int, seed: str) -> Dict[str, Any]:
+    """
+    Build one shuffled variant. The permutation only depends on (seed, index),
+    so the same request always reproduces the same papers and keys.
+    """
+    rng = random.Random(f"{seed}:{index}")
+    variant = copy.deepcopy(quiz_data)
+
+    questions = variant.get("questions", [])
+    rng.shuffle(questions)
+
+    answer_key = []
+    for position, question in enumerate(questions, 1):
+        question["original_id"] = question.get("id")
+        question["id"] = position
+        if question.get("question_type", "mcq") == "mcq":
+            _shuffle_options(question, rng)
+        answer_key.append({
+            "question_id": position,
+            "original_question_id": question["original_id"],
+            "answer": question.get("correct_answer", question.get("answer"))
+        })
+
+    variant["questions"] = questions
+    variant["answer_key"] = answer_key
+    variant["variant_label"] = variant_label(index)
+    variant["variant_seed"] = seed
+    return variant
+
+
+def build_variants(quiz_data: Dict[str, Any], count: int, seed: Optional[str] = None) -> List[Dict[str, Any]]:
+    seed = seed if seed is not None else "0"
+    return [build_variant(quiz_data, index, seed) for index in range(count)]
@@ -0,0 +1,128 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+# Same budget summarize_text() gives a lesson plan prompt's source text
+DEFAULT_PROMPT_BUDGET = 4000
+DEFAULT_WINDOW_SECONDS = 60
+
+_WORD_PATTERN = re.compile(r"[a-z][a-z'\-]+")
+# Caption annotations such as [Music] or (applause)
+_ANNOTATION_PATTERN = re.compile(r"\[[^\]]*\]|\([^)]*\)")
+
+_STOPWORDS = frozenset("""
+a an the and or but if so of to in on at by for with from into onto about as is are was were be been being am
+it its it's this that these those there here then than you your you're we our we're they their they're he she
+him her his i i'm me my mine what which who whom when where why how all any some no not can could will would
+shall should may might must do does did done have has had having just also very really like okay ok um uh yeah
+right now going gonna get got let let's know see say said one two thing things way well out up down over again
+""".split())
+
+
+def _format_time(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def _terms(text: str) -> List[str]:
+    return [w for w in _WORD_PATTERN.findall(text.lower()) if w not in _STOPWORDS and len(w) > 2]
+
+
+def build_windows(segments: List[Dict[str, Any]], window_seconds: int = DEFAULT_WINDOW_SECONDS) -> List[Dict[str, Any]]:
+    """
+    Group timed transcript segments ({text, start, duration}) into windows of
+    about window_seconds, split on segment boundaries.
+    """
+    windows = []
+    current = None
+    for segment in segments:
+        text = _ANNOTATION_PATTERN.sub("", segment.get("text", "")).replace("\n", " ").strip()
+        if not text:
+            continue
+        start = float(segment.get("start", 0.0))
+        end = start + float(segment.get("duration", 0.0))
+        if current is None or start - current["start"] >= window_seconds:
+            current = {"start": start, "end": end, "parts": []}
+            windows.append(current)
+        current["parts"].append(text)
+        current["end"] = max(current["end"], end)
+
+    return [{"start": w["start"], "end": w["end"], "text": " ".join(w["parts"])} for w in windows]
+
+
+def score_windows(windows: List[Dict[str, Any]], topic: Optional[str] = None) -> List[float]:
+    """
+    Score each window by relevance and density.
+
+    Relevance sums the salience of the window's distinct terms: terms the video
+    repeats often (its subject) but that are concentrated in few windows score
+    highest. Terms from the requested topic get an extra boost. Density is the
+    share of content words, so filler-heavy stretches rank lower.
+    """
+    window_terms = [_terms(w["text"]) for w in windows]
+    total = Counter()
+    document_frequency = Counter()
+    for terms in window_terms:
+        total.update(terms)
+        document_frequency.update(set(terms))
+
+    count = len(windows)
+    salience = {
+        term: math.log1p(total[term]) * math.log1p(count / document_frequency[term])
+        for term in total
+    }
+    topic_terms = set(_terms(topic or ""))
+
+    scores = []
+    for window, terms in zip(windows, window_terms):
+        words = len(window["text"].split()) or 1
+        unique = set(terms)
+        relevance = sum(salience[t] for t in unique) / math.sqrt(len(unique) or 1)
+        density = len(terms) / words
+        topic_bonus = 1.0 + sum(2.0 for t in unique & topic_terms)
+        scores.append(relevance * density * topic_bonus)
+    return scores
+
+
+def _format_window(window: Dict[str, Any]) -> str:
+    return f"[{_format_time(window['start'])}–{_format_time(window['end'])}] {window['text']}"
+
+
+def select_transcript_excerpts(
+    segments: List[Dict[str, Any]],
+    topic: Optional[str] = None,
+    max_chars: int = DEFAULT_PROMPT_BUDGET,
+    window_seconds: int = DEFAULT_WINDOW_SECONDS
+) -> str:
+    """
+    Build prompt text from a timed transcript: the highest-scoring windows that
+    fit in max_chars, in video order, each prefixed with its [mm:ss–mm:ss] range.
+    """
+    windows = build_windows(segments, window_seconds)
+    if not windows:
+        return ""
+
+    formatted = [_format_window(w) for w in windows]
+    if sum(len(text) + 2 for text in formatted) <= max_chars:
+        return "\n\n".join(formatted)
+
+    scores = score_windows(windows, topic)
+    chosen = []
+    used = 0
+    for index in sorted(range(len(windows)), key=lambda i: scores[i], reverse=True):
+        length = len(formatted[index]) + 2
+        if used + length <= max_chars:
+            chosen.append(index)
+            used += length
+
+    if not chosen:
+        # Even the best window is over budget; keep its beginning
+        best = max(range(len(windows)), key=lambda i: scores[i])
+        return formatted[best][:max_chars]
+
+    return "\n\n".join(formatted[i] for i in sorted(chosen))
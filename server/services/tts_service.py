@@ -1,5 +1,24 @@
 import edge_tts
+import asyncio
 import io
+import os
+import re
+import time
+from typing import Optional, AsyncIterator, List, Dict, Any, Iterator, Tuple
+from services.disk_cache import DiskCache
+from services.memory_cache import LRUCache
+from services import metrics
+
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "1024"))
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "600"))
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+TTS_PRESYNTH_CONCURRENCY = int(os.getenv("TTS_PRESYNTH_CONCURRENCY", "2"))
+# Pre-synthesis job status is kept for this many lesson plans, for at most this long
+TTS_PRESYNTH_JOBS_MAX = int(os.getenv("TTS_PRESYNTH_JOBS_MAX", "512"))
+TTS_PRESYNTH_JOB_TTL = float(os.getenv("TTS_PRESYNTH_JOB_TTL", "86400"))
+
+# TTS_CACHE_MAX_MB=0 disables the audio cache
+audio_cache = DiskCache("tts", max_bytes=TTS_CACHE_MAX_MB * 1024 * 1024, suffix=".mp3") if TTS_CACHE_MAX_MB > 0 else None
 
 async def generate_speech(text: str, voice: str = "en-US-AriaNeural", rate: str = "+0%", pitch: str = "+0Hz") -> bytes:
     """
@@ -22,3 +41,204 @@ async def generate_speech(text: str, voice: str = "en-US-AriaNeural", rate: str
             audio_stream.write(chunk["data"])
             
     return audio_stream.getvalue()
+
+async def stream_speech(text: str, voice: str = "en-US-AriaNeural", rate: str = "+0%", pitch: str = "+0Hz") -> AsyncIterator[bytes]:
+    """
+    Yield MP3 chunks as edge-tts produces them. The stream is only pulled as
+    fast as the consumer takes chunks, so a slow client throttles synthesis.
+    """
+    communicate = edge_tts.Communicate(text, voice, rate=rate, pitch=pitch)
+    started = time.perf_counter()
+    first = True
+
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            if first:
+                metrics.observe("tts_first_chunk_seconds", time.perf_counter() - started)
+                first = False
+            yield chunk["data"]
+
+def audio_cache_key(text: str, voice: str, rate: str, pitch: str, long_form: bool = False) -> str:
+    """Content address of a synthesized clip."""
+    parts = [voice, rate, pitch, text]
+    if long_form:
+        # Chunked synthesis pauses differently at chunk boundaries
+        parts.insert(0, "long")
+    return "\x1f".join(parts)
+
+def audio_id(text: str, voice: str, rate: str, pitch: str, long_form: bool = False) -> str:
+    """Public identifier of a cached clip, used in /api/tts/audio/{audio_id} URLs."""
+    return DiskCache.hash_key(audio_cache_key(text, voice, rate, pitch, long_form))
+
+def get_cached_speech_path(text: str, voice: str, rate: str, pitch: str, long_form: bool = False) -> Optional[str]:
+    if audio_cache is None:
+        return None
+    path = audio_cache.get_path(audio_cache_key(text, voice, rate, pitch, long_form))
+    metrics.increment("tts_cache_hits" if path else "tts_cache_misses")
+    return path
+
+async def generate_speech_cached(text: str, voice: str = "en-US-AriaNeural", rate: str = "+0%", pitch: str = "+0Hz", long_form: bool = False) -> str:
+    """
+    Return the path of the MP3 for (text, voice, rate, pitch), synthesizing and
+    caching it on a miss. Replays never go back to edge-tts.
+    """
+    path = get_cached_speech_path(text, voice, rate, pitch, long_form)
+    if path:
+        return path
+    return await cache_speech(text, voice, rate, pitch, long_form)
+
+async def cache_speech(text: str, voice: str, rate: str, pitch: str, long_form: bool = False) -> str:
+    """Synthesize a clip into the audio cache and return its path."""
+    if audio_cache is None:
+        raise ValueError("TTS audio cache is disabled")
+    if long_form:
+        # Drain the chunked stream; it writes the whole clip into the cache on completion
+        async for _ in stream_speech_cached(text, voice, rate, pitch, long_form=True):
+            pass
+        path = audio_cache.get_path(audio_cache_key(text, voice, rate, pitch, long_form))
+        if not path:
+            raise ValueError("TTS service returned no audio")
+        return path
+
+    audio_data = await generate_speech(text, voice, rate, pitch)
+    if not audio_data:
+        raise ValueError("TTS service returned no audio")
+    metrics.increment("tts_cache_bytes_written", len(audio_data))
+    return audio_cache.put(audio_cache_key(text, voice, rate, pitch), audio_data)
+
+def split_text_for_speech(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """
+    Split a long script at paragraph and sentence boundaries into chunks of at
+    most max_chars. Sentences are only grouped within a paragraph, so editing
+    one paragraph leaves the chunks (and cached audio) of the others unchanged.
+    """
+    chunks = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+
+        current = ""
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            # Very long sentences are split at word boundaries
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}".strip()
+        if current:
+            chunks.append(current)
+    return chunks
+
+async def _synthesize_chunk(chunk: str, voice: str, rate: str, pitch: str, semaphore: asyncio.Semaphore) -> bytes:
+    async with semaphore:
+        if audio_cache is None:
+            return await generate_speech(chunk, voice, rate, pitch)
+        path = await generate_speech_cached(chunk, voice, rate, pitch)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted right after being written
+            return await generate_speech(chunk, voice, rate, pitch)
+
+async def stream_speech_long_form(text: str, voice: str = "en-US-AriaNeural", rate: str = "+0%", pitch: str = "+0Hz") -> AsyncIterator[bytes]:
+    """
+    Synthesize sentence/paragraph chunks concurrently (at most TTS_MAX_CONCURRENCY
+    edge-tts sessions) and yield their MP3 frames in order as soon as the head
+    chunk is ready. Each chunk is cached on its own, so an edited script only
+    re-synthesizes the chunks whose text changed.
+    """
+    chunks = split_text_for_speech(text)
+    semaphore = asyncio.Semaphore(TTS_MAX_CONCURRENCY)
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(_synthesize_chunk(chunk, voice, rate, pitch, semaphore)) for chunk in chunks]
+    try:
+        for idx, task in enumerate(tasks):
+            data = await task
+            if idx == 0:
+                metrics.observe("tts_first_chunk_seconds", time.perf_counter() - started)
+            yield data
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def stream_speech_cached(text: str, voice: str = "en-US-AriaNeural", rate: str = "+0%", pitch: str = "+0Hz", long_form: bool = False) -> AsyncIterator[bytes]:
+    """
+    Stream a clip while teeing it into the audio cache. The entry only becomes
+    visible once synthesis finished; an aborted stream leaves nothing behind.
+    """
+    key = audio_cache_key(text, voice, rate, pitch, long_form)
+    writer = audio_cache.open_writer(key) if audio_cache is not None else None
+    source = stream_speech_long_form if long_form else stream_speech
+    written = 0
+    try:
+        async for data in source(text, voice, rate, pitch):
+            if writer:
+                writer.write(data)
+                written += len(data)
+            yield data
+    except BaseException:
+        # Includes client disconnects (GeneratorExit / cancellation)
+        if writer:
+            writer.discard()
+        raise
+    if writer:
+        if written:
+            writer.commit()
+            metrics.increment("tts_cache_bytes_written", written)
+        else:
+            writer.discard()
+
+# lesson plan id -> progress of its pre-synthesis job (per process, bounded)
+presynthesis_jobs = LRUCache(maxsize=TTS_PRESYNTH_JOBS_MAX, ttl=TTS_PRESYNTH_JOB_TTL)
+
+def use_long_form(text: str) -> bool:
+    """Scripts longer than one chunk are synthesized in long-form mode."""
+    return len(text) > TTS_CHUNK_CHARS
+
+def iter_teacher_scripts(content: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """Yield (JSON path, teacherScript) for every timeline item of a lesson plan."""
+    for s_idx, section in enumerate(content.get("subtopicSections") or []):
+        for t_idx, item in enumerate(section.get("timeline") or []):
+            script = (item.get("teacherScript") or "").strip() if isinstance(item, dict) else ""
+            if script:
+                yield f"subtopicSections[{s_idx}].timeline[{t_idx}]", script
+
+async def presynthesize_lesson_plan(lesson_plan_id: int, content: Dict[str, Any], voice: str = "en-US-AriaNeural", rate: str = "+0%", pitch: str = "+0Hz"):
+    """
+    Background job: synthesize every teacherScript of a lesson plan into the
+    audio cache (at most TTS_PRESYNTH_CONCURRENCY at a time) so playback in
+    class is a cache hit.
+    """
+    if audio_cache is None:
+        return
+
+    scripts = list(dict.fromkeys(script for _, script in iter_teacher_scripts(content)))
+    job = {"status": "running", "total": len(scripts), "done": 0, "failed": 0}
+    presynthesis_jobs.set(lesson_plan_id, job)
+    semaphore = asyncio.Semaphore(TTS_PRESYNTH_CONCURRENCY)
+    started = time.perf_counter()
+
+    async def synthesize(script: str):
+        async with semaphore:
+            try:
+                await generate_speech_cached(script, voice, rate, pitch, long_form=use_long_form(script))
+                job["done"] += 1
+            except Exception as e:
+                job["failed"] += 1
+                print(f"Pre-synthesis failed for lesson plan {lesson_plan_id}: {str(e)}")
+
+    await asyncio.gather(*(synthesize(script) for script in scripts))
+    job["status"] = "completed"
+    metrics.increment("tts_presynthesized_scripts", job["done"])
+    metrics.observe("tts_presynthesis_seconds", time.perf_counter() - started)
@@ -1,7 +1,15 @@
+import os
 import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api.formatters import TextFormatter
 from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
+from services.disk_cache import DiskCache
+from services.transcript_segments import select_transcript_excerpts, DEFAULT_PROMPT_BUDGET
+from services import metrics
 
 def extract_video_id(url: str) -> str:
     """
@@ -30,93 +38,102 @@ def extract_video_id(url: str) -> str:
 
     raise ValueError("Invalid YouTube URL format")
 
-def get_transcript(youtube_url: str) -> str:
-    """
-    Get transcript from YouTube video.
+TRANSCRIPT_CACHE_TTL_HOURS = float(os.getenv("TRANSCRIPT_CACHE_TTL_HOURS", "168"))
+TRANSCRIPT_CACHE_MAX_MB = int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "64"))
+TRANSCRIPT_FETCH_WORKERS = int(os.getenv("TRANSCRIPT_FETCH_WORKERS", "4"))
+# Beyond this many videos each one's share of the prompt budget is too small to be useful
+PLAYLIST_MAX_VIDEOS = int(os.getenv("PLAYLIST_MAX_VIDEOS", "8"))
 
-    Args:
-        youtube_url: YouTube video URL
+_transcript_cache = DiskCache("transcripts", max_bytes=TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024, suffix=".json")
 
-    Returns:
-        str: Concatenated transcript text without timestamps
+# One fetch per (video, language) at a time; concurrent requests wait and read the cache
+_fetch_locks: Dict[str, threading.Lock] = {}
+_fetch_locks_guard = threading.Lock()
 
-    Raises:
-        ValueError: If transcript is unavailable or video is invalid
+
+def _fetch_lock(key: str) -> threading.Lock:
+    with _fetch_locks_guard:
+        return _fetch_locks.setdefault(key, threading.Lock())
+
+
+def _select_transcript(transcript_list, language: str):
+    """
+    Pick the best transcript in one pass: manual in the preferred language,
+    then auto-generated in it, then the first available in any language.
+    """
+    best = None
+    best_rank = None
+    for position, t in enumerate(transcript_list):
+        rank = (t.language_code != language, t.is_generated, position)
+        if best_rank is None or rank < best_rank:
+            best, best_rank = t, rank
+    return best
+
+
+def _load_cached_transcript(key: str) -> Optional[Dict[str, Any]]:
+    data = _transcript_cache.get(key)
+    if data is None:
+        return None
+    try:
+        record = json.loads(data)
+    except ValueError:
+        return None
+    if time.time() - record.get("fetched_at", 0) > TRANSCRIPT_CACHE_TTL_HOURS * 3600:
+        return None
+    return record
+
+
+def _fetch_transcript_record(video_id: str, language: str) -> Dict[str, Any]:
+    transcript_info = _select_transcript(YouTubeTranscriptApi().list(video_id), language)
+    if not transcript_info:
+        raise ValueError("No transcripts available for this video")
+
+    if transcript_info.language_code != language:
+        print(f"⚠️  WARNING: Using non-{language} transcript ({transcript_info.language_code}). Translation may be needed for best results.")
+
+    segments = transcript_info.fetch().to_raw_data()
+    print(f"Fetched {len(segments)} transcript entries for {video_id} ({transcript_info.language_code}, generated={transcript_info.is_generated})")
+    return {
+        "video_id": video_id,
+        "language": transcript_info.language_code,
+        "is_generated": transcript_info.is_generated,
+        "fetched_at": time.time(),
+        "segments": segments
+    }
+
+
+def get_transcript_record(video_id: str, language: str = "en") -> Dict[str, Any]:
+    """
+    Return the transcript record (language, timed segments) for a video,
+    served from the transcript cache while it is younger than
+    TRANSCRIPT_CACHE_TTL_HOURS.
     """
+    key = f"{video_id}:{language}"
+    record = _load_cached_transcript(key)
+    if record is not None:
+        metrics.increment("transcript_cache_hits")
+        return record
+
+    with _fetch_lock(key):
+        # Another request may have fetched it while we waited
+        record = _load_cached_transcript(key)
+        if record is not None:
+            metrics.increment("transcript_cache_hits")
+            return record
+
+        metrics.increment("transcript_cache_misses")
+        started = time.perf_counter()
+        record = _fetch_transcript_record(video_id, language)
+        metrics.observe("transcript_fetch_seconds", time.perf_counter() - started)
+        _transcript_cache.put(key, json.dumps(record).encode("utf-8"))
+        return record
+
+
+def _get_transcript_record_for_url(youtube_url: str, language: str) -> Dict[str, Any]:
     try:
         # Extract video ID
         video_id = extract_video_id(youtube_url)
-
-        # Get transcript using the correct API methods
-        yt_api = YouTubeTranscriptApi()
-        transcript_list = yt_api.list(video_id)
-
-        # Try to get manually created transcript first (better quality)
-        try:
-            # TranscriptList is iterable but doesn't support len()
-            transcript_items = list(transcript_list)  # Convert to list
-            print(f"Available transcripts: {len(transcript_items)}")
-            for t in transcript_items:
-                print(f"  - Language: {t.language_code}, Generated: {t.is_generated}")
-
-            transcript_info = None
-
-            # First priority: Manual English transcript
-            for t in transcript_items:
-                if t.language_code == 'en' and not t.is_generated:
-                    transcript_info = t
-                    print(f"Found manual English transcript: {t}")
-                    break
-
-            # Second priority: Auto-generated English transcript
-            if not transcript_info:
-                for t in transcript_items:
-                    if t.language_code == 'en' and t.is_generated:
-                        transcript_info = t
-                        print(f"Found auto-generated English transcript: {t}")
-                        break
-
-            # Third priority: Any English transcript (regardless of generation type)
-            if not transcript_info:
-                for t in transcript_items:
-                    if t.language_code == 'en':
-                        transcript_info = t
-                        print(f"Found English transcript (any type): {t}")
-                        break
-
-            # Fourth priority: Any available transcript (if no English at all)
-            if not transcript_info and transcript_items:
-                transcript_info = transcript_items[0]  # Take first available
-                print(f"No English transcript found, using {transcript_info.language_code} transcript: {transcript_info}")
-
-            if transcript_info:
-                if transcript_info.language_code != 'en':
-                    print(f"⚠️  WARNING: Using non-English transcript ({transcript_info.language_code}). Translation may be needed for best results.")
-
-                print(f"Fetching transcript content from: {transcript_info}")
-                # fetch() returns a list of transcript entries
-                transcript_entries = transcript_info.fetch()
-                print(f"Successfully fetched {len(transcript_entries)} transcript entries")
-            else:
-                print("No transcripts found at all")
-                raise ValueError("No transcripts available for this video")
-
-        except Exception as e:
-            print(f"Transcript fetching error: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
-            raise ValueError("Failed to fetch transcript")
-
-        # Use TextFormatter to properly extract text from transcript entries
-        formatter = TextFormatter()
-        full_transcript = formatter.format_transcript(transcript_entries).strip()
-
-        print(f"Extracted transcript text (first 200 chars): {full_transcript[:200]}...")
-
-        if not full_transcript:
-            raise ValueError("Transcript is empty")
-
-        return full_transcript
+        return get_transcript_record(video_id, language)
 
     except TranscriptsDisabled:
         raise ValueError("Transcript not available for this video. Try 'Topic' mode or upload a PDF.")
@@ -129,3 +146,107 @@ def get_transcript(youtube_url: str) -> str:
             raise e
         else:
             raise ValueError(f"Failed to retrieve transcript: {str(e)}")
+
+
+def get_transcript(youtube_url: str, language: str = "en") -> str:
+    """
+    Get transcript from YouTube video.
+
+    Args:
+        youtube_url: YouTube video URL
+        language: Preferred transcript language
+
+    Returns:
+        str: Concatenated transcript text without timestamps
+
+    Raises:
+        ValueError: If transcript is unavailable or video is invalid
+    """
+    record = _get_transcript_record_for_url(youtube_url, language)
+    full_transcript = "\n".join(segment["text"] for segment in record["segments"]).strip()
+
+    print(f"Extracted transcript text (first 200 chars): {full_transcript[:200]}...")
+
+    if not full_transcript:
+        raise ValueError("Transcript is empty")
+
+    return full_transcript
+
+
+def get_timed_transcript(youtube_url: str, topic: Optional[str] = None, max_chars: int = DEFAULT_PROMPT_BUDGET, language: str = "en") -> str:
+    """
+    Get the most relevant parts of a YouTube transcript for a prompt.
+
+    Args:
+        youtube_url: YouTube video URL
+        topic: Optional topic used to rank transcript windows
+        max_chars: Character budget for the returned excerpts
+        language: Preferred transcript language
+
+    Returns:
+        str: Transcript excerpts, each prefixed with its [mm:ss–mm:ss] range
+
+    Raises:
+        ValueError: If transcript is unavailable or video is invalid
+    """
+    record = _get_transcript_record_for_url(youtube_url, language)
+    excerpts = select_transcript_excerpts(record["segments"], topic=topic, max_chars=max_chars)
+
+    if not excerpts:
+        raise ValueError("Transcript is empty")
+
+    print(f"DEBUG: Selected {len(excerpts)} chars of timed transcript excerpts for {record['video_id']}")
+    return excerpts
+
+
+def get_transcripts(youtube_urls: List[str], language: str = "en", max_workers: int = TRANSCRIPT_FETCH_WORKERS, topic: Optional[str] = None, max_chars: Optional[int] = None) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Get transcripts for several videos (e.g. a playlist) concurrently.
+
+    Args:
+        youtube_urls: YouTube video URLs
+        language: Preferred transcript language
+        max_workers: Maximum number of concurrent fetches
+        topic: Optional topic used to rank transcript windows
+        max_chars: If set, return timed excerpts within this budget per video
+
+    Returns:
+        list: (url, transcript, error) per URL, in input order
+    """
+    def fetch(url: str):
+        try:
+            if max_chars:
+                return url, get_timed_transcript(url, topic, max_chars, language), None
+            return url, get_transcript(url, language), None
+        except ValueError as e:
+            return url, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(executor.map(fetch, youtube_urls))
+
+
+def _playlist_header(index: int, url: str) -> str:
+    return f"Video {index + 1} ({url}):\n"
+
+
+def get_playlist_text(youtube_urls: List[str], topic: Optional[str] = None, max_chars: int = DEFAULT_PROMPT_BUDGET) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Prompt text for several videos that fits in max_chars in total.
+
+    Only the first PLAYLIST_MAX_VIDEOS URLs are used. The budget left after the
+    per-video headers and separators is split evenly between the videos.
+
+    Returns:
+        tuple: (text, [(url, error) for videos without a transcript])
+    """
+    urls = youtube_urls[:PLAYLIST_MAX_VIDEOS]
+    overhead = sum(len(_playlist_header(i, url)) for i, url in enumerate(urls)) + 2 * (len(urls) - 1)
+    per_video = (max_chars - overhead) // len(urls)
+    if per_video <= 0:
+        raise ValueError("Video URLs are too long for the prompt budget")
+
+    transcripts = get_transcripts(urls, topic=topic, max_chars=per_video)
+    parts = [_playlist_header(i, url) + transcript for i, (url, transcript, _) in enumerate(transcripts) if transcript]
+    skipped = [(url, error) for url, _, error in transcripts if error]
+    skipped.extend((url, f"only the first {PLAYLIST_MAX_VIDEOS} videos are used") for url in youtube_urls[PLAYLIST_MAX_VIDEOS:])
+    return "\n\n".join(parts), skipped
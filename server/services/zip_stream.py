@@ -0,0 +1,44 @@
+import zipfile
+from typing import List
+
+
+class _ChunkBuffer:
+    """Write-only, non-seekable file object; zipfile falls back to data descriptors."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """
+    Incrementally builds a ZIP archive. Each call returns the bytes produced so
+    far so they can be sent to the client immediately; only the entry being
+    written is ever held in memory.
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_STORED):
+        self._buffer = _ChunkBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, mode="w", compression=compression)
+
+    def add(self, name: str, data: bytes) -> bytes:
+        """Add a file entry and return the archive bytes it produced."""
+        with self._zip.open(name, mode="w") as entry:
+            entry.write(data)
+        return self._buffer.drain()
+
+    def close(self) -> bytes:
+        """Write the central directory and return the final bytes."""
+        self._zip.close()
+        return self._buffer.drain()